@@ -0,0 +1,85 @@
+#! -*- coding: utf-8 -*-
+"""
+Shared helpers of the benchmarks: django setup and synthetic stats files
+"""
+
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import django  # noqa: E402
+from django.conf import settings  # noqa: E402
+
+
+def setup(**overrides):
+    """
+    Configure a minimal django project, cartographer options can be given
+    """
+    if settings.configured:
+        return
+    settings.configure(
+        DEBUG=False,
+        INSTALLED_APPS=["django.contrib.staticfiles", "cartographer"],
+        STATIC_URL="/static/",
+        TEMPLATES=[{
+            "BACKEND": "django.template.backends.django.DjangoTemplates",
+            "APP_DIRS": True,
+        }],
+        CARTOGRAPHER={},
+        CARTOGRAPHER_OPTIONS=dict({"WATCHER": None}, **overrides),
+    )
+    django.setup()
+
+
+def chunk_files(chunk, files):
+    """
+    Files of a synthetic chunk, a shared runtime and vendor first then
+    hashed js/css and an ignored source map
+    """
+    names = ["runtime.0a1b2c3d.js", "vendor.4e5f6a7b.js"][:files]
+    for index in range(len(names), files):
+        if index == files - 1 and files > 3:
+            names.append("chunk-{}.{:08x}.js.map".format(chunk, index))
+            continue
+        names.append("chunk-{}.{:08x}.{}".format(
+            chunk, index, "css" if index % 4 == 0 else "js"))
+    return [{"name": name, "path": "/srv/app/webpack_bundles/" + name}
+            for name in names]
+
+
+def generate_stats(path, chunks, files, modules=0, status="done",
+                   prefix="entry"):
+    """
+    Write a webpack-bundle-tracker like stats file, ``modules`` adds
+    verbose entries parsers have to skip, chunks are named ``prefix-N``
+    Returns the chunk names
+    """
+    names = ["{}-{}".format(prefix, chunk) for chunk in range(chunks)]
+    document = {
+        "status": status,
+        "publicPath": "/static/webpack_bundles/",
+        "chunks": {name: chunk_files(index, files)
+                   for index, name in enumerate(names)},
+    }
+    if modules:
+        document["modules"] = [
+            {"id": module, "name": "./src/module-{}.js".format(module),
+             "source": "export default function () {}\n" * 8}
+            for module in range(modules)]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as stats:
+        json.dump(document, stats)
+    os.replace(tmp_path, path)
+    return names
+
+
+def configure_bundles(source, names):
+    """
+    Point CARTOGRAPHER at ``source`` for the given bundle names
+    """
+    settings.CARTOGRAPHER = {
+        "WEBPACK": {name: {"SOURCE": source} for name in names},
+    }
@@ -0,0 +1,74 @@
+#! -*- coding: utf-8 -*-
+"""
+Startup discovery of many independent stats sources
+
+One stats file per micro frontend build, each with its own bundles and
+verbose modules, loaded by autodiscover() one after another then with
+DISCOVERY_WORKERS threads. json decoding holds the GIL, parsing runs in
+parallel with PARSER_PROCESSES, reading from slow disks and hashing files
+(INTEGRITY) overlap anyway.
+
+    python benchmarks/discovery.py
+    python benchmarks/discovery.py --sources 48 --workers 8 --processes 8
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Startup discovery of many stats sources")
+    parser.add_argument("--sources", type=int, default=24)
+    parser.add_argument("--chunks", type=int, default=20,
+                        help="Bundles per source")
+    parser.add_argument("--modules", type=int, default=5000,
+                        help="Verbose modules entries per source")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="DISCOVERY_WORKERS of the parallel runs")
+    parser.add_argument("--processes", type=int, default=0,
+                        help="PARSER_PROCESSES, 0 parses in the threads")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    common.setup(PARSER_PROCESSES=args.processes, LAZY=False)
+    from django.conf import settings
+    from cartographer import parsers
+
+    with tempfile.TemporaryDirectory() as directory:
+        config = {}
+        for index in range(args.sources):
+            source = os.path.join(directory, "stats-{}.json".format(index))
+            names = common.generate_stats(
+                source, args.chunks, 4, args.modules,
+                prefix="app{}-entry".format(index))
+            config.update((name, {"SOURCE": source}) for name in names)
+        settings.CARTOGRAPHER = {"WEBPACK": config}
+
+        def run(workers):
+            settings.CARTOGRAPHER_OPTIONS["DISCOVERY_WORKERS"] = workers
+            timings = []
+            for _ in range(args.repeat):
+                parsers._stats_cache.clear()
+                start = time.perf_counter()
+                bundles = parsers.autodiscover()
+                timings.append(time.perf_counter() - start)
+            return statistics.median(timings), len(bundles)
+
+        print("{} sources, {} bundles each, {} modules, {} processes".format(
+            args.sources, args.chunks, args.modules, args.processes))
+        for label, workers in (("sequential", 0),
+                               ("{} workers".format(args.workers),
+                                args.workers)):
+            elapsed, count = run(workers)
+            print("{:<12} {:>8.1f}ms  {} bundles".format(
+                label, elapsed * 1000, count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+#! -*- coding: utf-8 -*-
+"""
+Parse, reload and render hot paths benchmark
+
+Synthetic webpack stats files from 10 to 10,000 chunks and 1 to 500
+files per chunk are generated, then are measured:
+
+- autodiscover: cold start, nothing parsed nor resolved yet
+- rediscover: reload after the stats file changed
+- manager render: AssetTagsManagerFromManifest.render_bundle, uncached
+  and cached
+- template tag: {% render_bundle %} from a django template
+
+Wall time is the median of --repeat runs, allocations and peak memory
+come from an extra run under tracemalloc.
+
+    python benchmarks/hotpaths.py
+    python benchmarks/hotpaths.py --scenario 1000x10 --json after.json
+    python benchmarks/hotpaths.py --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import common
+
+common.setup()
+
+import django  # noqa: E402
+from django.template import Context, Template  # noqa: E402
+
+from cartographer import parsers  # noqa: E402
+from cartographer.registry import get_registry  # noqa: E402
+from cartographer.resolvers import get_resolver  # noqa: E402
+from cartographer.tagsmanager import (  # noqa: E402
+    AssetTagsManagerFromManifest, fragments, items)
+
+# (chunks, files per chunk)
+SCENARIOS = [(10, 1), (10, 500), (100, 10), (1000, 10), (1000, 50),
+             (10000, 1), (10000, 5)]
+# Configured bundles are at most this many, like a real project
+MAX_BUNDLES = 40
+
+
+def reset():
+    """
+    Forget everything parsed, resolved or rendered
+    """
+    parsers._stats_cache.clear()
+    parsers._digests_cache.clear()
+    get_resolver().clear()
+    fragments.clear()
+    items.clear()
+    get_registry().publish({}, replace=True)
+
+
+def touch(path):
+    """
+    New mtime, the next reload parses the file again
+    """
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+
+def measure(operation, prepare, repeat):
+    """
+    Median wall time, allocated blocks/bytes and peak traced memory
+    """
+    timings = []
+    for _ in range(repeat):
+        prepare()
+        start = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - start)
+    prepare()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    operation()
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    allocated = [stat for stat in after.compare_to(before, "filename")
+                 if stat.size_diff > 0]
+    return {
+        "time": statistics.median(timings),
+        "blocks": sum(stat.count_diff for stat in allocated),
+        "bytes": sum(stat.size_diff for stat in allocated),
+        "peak": peak,
+    }
+
+
+def run_scenario(directory, chunks, files, repeat, renders):
+    source = os.path.join(directory, "stats-{}x{}.json".format(chunks, files))
+    names = common.generate_stats(source, chunks, files)
+    bundles = names[:MAX_BUNDLES]
+    common.configure_bundles(source, bundles)
+    manager = AssetTagsManagerFromManifest()
+    template = Template("".join(
+        '{{% load render_bundle from cartographer_tags %}}'
+        '{{% render_bundle "{}" "js, css" %}}'.format(name)
+        for name in bundles[:10]))
+
+    def render_all():
+        for _ in range(renders):
+            for name in bundles:
+                manager.render_bundle(name, "js, css")
+
+    def render_cold():
+        for name in bundles:
+            fragments.clear()
+            items.clear()
+            manager.render_bundle(name, "js, css")
+
+    def render_template():
+        for _ in range(renders):
+            template.render(Context())
+
+    def clear_renders():
+        fragments.clear()
+        items.clear()
+
+    def warm():
+        reset()
+        parsers.autodiscover()
+
+    def changed():
+        touch(source)
+
+    results = {}
+    results["autodiscover"] = measure(parsers.autodiscover, reset, repeat)
+    warm()
+    results["rediscover"] = measure(parsers.rediscover, changed, repeat)
+    results["render (uncached)"] = measure(render_cold, clear_renders,
+                                           repeat)
+    results["render (cached) x{}".format(renders)] = measure(
+        render_all, lambda: None, repeat)
+    results["template tag x{}".format(renders)] = measure(
+        render_template, lambda: None, repeat)
+    os.remove(source)
+    return results
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=common.ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if abs(size) < 1024:
+            return "{:.0f} {}".format(size, unit)
+        size /= 1024.0
+    return "{:.1f} GiB".format(size)
+
+
+def report(data, previous=None):
+    print("commit {commit}, python {python}, django {django}".format(**data))
+    header = "{:>12} {:<22} {:>11} {:>9} {:>10} {:>10}".format(
+        "scenario", "operation", "time", "blocks", "allocated", "peak")
+    if previous:
+        header += " {:>8}".format("vs prev")
+    print(header)
+    for scenario, results in data["results"].items():
+        for operation, result in results.items():
+            line = "{:>12} {:<22} {:>9.3f}ms {:>9} {:>10} {:>10}".format(
+                scenario, operation, result["time"] * 1000,
+                result["blocks"], format_size(result["bytes"]),
+                format_size(result["peak"]))
+            old = previous and previous["results"].get(
+                scenario, {}).get(operation)
+            if old:
+                line += " {:>7.2f}x".format(result["time"] / old["time"])
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Parse, reload and render hot paths benchmark")
+    parser.add_argument(
+        "--scenario", action="append", default=None,
+        help="CHUNKSxFILES, can be repeated, defaults to {}".format(
+            " ".join("{}x{}".format(*s) for s in SCENARIOS)))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--renders", type=int, default=100,
+                        help="Render passes of the cached measures")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results of a previous --json run")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.scenario:
+        scenarios = [tuple(int(n) for n in s.split("x"))
+                     for s in args.scenario]
+    data = {
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for chunks, files in scenarios:
+            key = "{}x{}".format(chunks, files)
+            sys.stderr.write("running {}\n".format(key))
+            data["results"][key] = run_scenario(
+                directory, chunks, files, args.repeat, args.renders)
+    previous = None
+    if args.compare:
+        with open(args.compare) as compared:
+            previous = json.load(compared)
+    report(data, previous)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(data, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
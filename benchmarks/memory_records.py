@@ -0,0 +1,112 @@
+#! -*- coding: utf-8 -*-
+"""
+Memory used by the registry structures
+
+Compares the compact Asset records / slotted Bundle with the previous
+structures: UserDict bundles holding the raw webpack file dicts plus an
+"url" key.
+
+    python benchmarks/memory_records.py [--bundles 200] [--assets 50]
+"""
+
+import argparse
+import collections
+import tracemalloc
+
+import common
+
+common.setup()
+
+from cartographer.registry import Asset, Bundle  # noqa: E402
+
+TAG_TEMPLATES = {
+    "js": "cartographer/javascript_tag.html",
+    "css": "cartographer/stylesheet_tag.html",
+}
+
+
+class LegacyBundle(collections.UserDict):
+    """
+    Shape of the bundles before the compact records
+    """
+    def __init__(self, **kw):
+        for k, v in kw.items():
+            setattr(self, k, v)
+        super(LegacyBundle, self).__init__()
+
+
+def iter_chunks(bundles, assets):
+    """
+    Webpack stats like chunks, fresh strings as json.load builds them
+    """
+    for b in range(bundles):
+        chunk = []
+        for a in range(assets):
+            name = "chunk-{}.{:08x}.{}".format(a, b * assets + a,
+                                               "js" if a % 3 else "css")
+            chunk.append({
+                "name": name,
+                "path": "/srv/app/assets/webpack_bundles/{}".format(name),
+                "publicPath": "/static/webpack_bundles/{}".format(name),
+            })
+        yield "bundle-{}".format(b), chunk
+
+
+def build_legacy(chunks):
+    registry = collections.UserDict()
+    for name, chunk in chunks:
+        bundle = LegacyBundle(name=name, ORIGIN="WEBPACK", SOURCE="s.json",
+                              BUNDLES_DIRNAME="webpack_bundles/",
+                              TAG_TEMPLATES=TAG_TEMPLATES)
+        for _file in chunk:
+            bundle[_file["name"]] = dict(_file, url="/static/{}".format(
+                "webpack_bundles/" + _file["name"]))
+        registry[name] = bundle
+    return registry
+
+
+def build_compact(chunks):
+    registry = {}
+    for name, chunk in chunks:
+        registry[name] = Bundle(
+            (Asset.create(_file["name"], "/static/{}".format(
+                "webpack_bundles/" + _file["name"])) for _file in chunk),
+            name=name, ORIGIN="WEBPACK", SOURCE="s.json",
+            BUNDLES_DIRNAME="webpack_bundles/", TAG_TEMPLATES=TAG_TEMPLATES)
+    return registry
+
+
+def measure(builder, bundles, assets):
+    """
+    Memory retained by the registry once the parsed document is released
+    """
+    tracemalloc.start()
+    chunks = list(iter_chunks(bundles, assets))
+    registry = builder(chunks)
+    del chunks
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return registry, current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--bundles", type=int, default=200)
+    parser.add_argument("--assets", type=int, default=50)
+    args = parser.parse_args()
+
+    # Shared templates are loaded once per process, do not count them
+    build_compact(iter_chunks(1, 1))
+    results = [(label, measure(builder, args.bundles, args.assets)[1])
+               for label, builder in (("legacy", build_legacy),
+                                      ("compact", build_compact))]
+    total = args.bundles * args.assets
+    print("{} bundles x {} assets".format(args.bundles, args.assets))
+    for label, size in results:
+        print("{:8} {:>12,} bytes {:>8.1f} bytes/asset".format(
+            label, size, size / total))
+    print("saved    {:>12.1%}".format(1 - results[1][1] / results[0][1]))
+
+
+if __name__ == "__main__":
+    main()
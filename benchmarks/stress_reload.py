@@ -0,0 +1,338 @@
+#! -*- coding: utf-8 -*-
+"""
+Reload while rendering stress harness
+
+A writer thread rewrites a synthetic webpack stats file in a loop: atomic
+renames, in place writes, partial writes completed later, truncated files
+and "compiling" statuses. Every write embeds a version in the file names.
+Meanwhile reloads run (from a reloader thread calling rediscover(), or from
+the configured watcher backend) and N threads render bundles.
+
+Every render is checked: its files must all come from one version and be
+as many as the bundle has, otherwise the read is torn. Missing bundles,
+NotRegisteredAsset and any other exception are counted.
+
+    python benchmarks/stress_reload.py
+    python benchmarks/stress_reload.py --threads 32 --duration 30
+    python benchmarks/stress_reload.py --reloader watcher --watcher poll
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import common
+
+VERSION_RE = re.compile(r'\.v(\d+)\.')
+WRITE_MODES = ("atomic", "in-place", "partial", "truncated", "compiling")
+
+
+def build_document(version, chunks, files, status="done"):
+    """
+    Stats document whose file names all carry ``version``
+    """
+    document = {"status": status, "chunks": {}}
+    if status != "done":
+        return document
+    for chunk in range(chunks):
+        document["chunks"]["entry-{}".format(chunk)] = [
+            dict(_file, name=_file["name"].replace(
+                ".", ".v{}.".format(version), 1))
+            for _file in common.chunk_files(chunk, files)]
+    return document
+
+
+def expected_tags(files):
+    """
+    Tags rendered per bundle, source maps are ignored
+    """
+    return len([_file for _file in common.chunk_files(0, files)
+                if not _file["name"].endswith(".map")])
+
+
+class Writer(threading.Thread):
+    """
+    Rewrites the stats file until stopped, cycling through WRITE_MODES
+    """
+    def __init__(self, path, chunks, files, interval, stop):
+        super(Writer, self).__init__(name="stress-writer", daemon=True)
+        self.path = path
+        self.chunks = chunks
+        self.files = files
+        self.interval = interval
+        self.stop = stop
+        self.writes = collections.Counter()
+        self.version = 0
+
+    def write(self, content, atomic=False):
+        if atomic:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as stats:
+                stats.write(content)
+            os.replace(tmp_path, self.path)
+        else:
+            with open(self.path, "w", encoding="utf-8") as stats:
+                stats.write(content)
+
+    def write_version(self, mode):
+        self.version += 1
+        status = "compiling" if mode == "compiling" else "done"
+        content = json.dumps(build_document(
+            self.version, self.chunks, self.files, status))
+        if mode in ("atomic", "compiling"):
+            self.write(content, atomic=True)
+        elif mode == "in-place":
+            self.write(content)
+        else:
+            # Half written, seen by the reloads for a while
+            cut = random.randint(1, len(content) - 1)
+            with open(self.path, "w", encoding="utf-8") as stats:
+                stats.write(content[:cut])
+                stats.flush()
+                if mode == "partial":
+                    time.sleep(self.interval)
+                    stats.write(content[cut:])
+            if mode == "truncated":
+                time.sleep(self.interval)
+                self.write(content)
+        self.writes[mode] += 1
+
+    def run(self):
+        modes = list(WRITE_MODES)
+        while not self.stop.is_set():
+            self.write_version(random.choice(modes))
+            time.sleep(self.interval)
+
+
+class Reloader(threading.Thread):
+    """
+    Calls rediscover() in a loop, like a watcher flooded with events
+    """
+    def __init__(self, interval, stop, errors):
+        super(Reloader, self).__init__(name="stress-reloader", daemon=True)
+        self.interval = interval
+        self.stop = stop
+        self.errors = errors
+        self.reloads = 0
+
+    def run(self):
+        from cartographer import parsers
+        while not self.stop.is_set():
+            try:
+                parsers.rediscover()
+            except Exception as e:
+                self.errors[type(e).__name__] += 1
+            self.reloads += 1
+            time.sleep(self.interval)
+
+
+class Renderer(threading.Thread):
+    """
+    Renders random bundles until stopped, checking every output
+    """
+    def __init__(self, index, bundles, tags, stop):
+        super(Renderer, self).__init__(
+            name="stress-render-{}".format(index), daemon=True)
+        self.bundles = bundles
+        self.tags = tags
+        self.stop = stop
+        self.latencies = []
+        self.counts = collections.Counter()
+
+    def check(self, fragment):
+        versions = VERSION_RE.findall(fragment)
+        if len(set(versions)) != 1 or len(versions) != self.tags:
+            self.counts["torn"] += 1
+
+    def run(self):
+        from cartographer.errors import (NotRegisteredAsset,
+                                         NotRegisteredBundle)
+        from cartographer.tagsmanager import AssetTagsManagerFromManifest
+        manager = AssetTagsManagerFromManifest()
+        while not self.stop.is_set():
+            name = random.choice(self.bundles)
+            start = time.perf_counter()
+            try:
+                fragment = manager.render_bundle(name, "js, css")
+            except NotRegisteredBundle:
+                self.counts["missing bundle"] += 1
+                continue
+            except NotRegisteredAsset:
+                self.counts["NotRegisteredAsset"] += 1
+                continue
+            except Exception as e:
+                self.counts[type(e).__name__] += 1
+                continue
+            finally:
+                self.latencies.append(time.perf_counter() - start)
+            self.counts["renders"] += 1
+            self.check(fragment)
+
+
+class ErrorCounter(logging.Handler):
+    """
+    Counts the errors logged by cartographer, watcher and retried reloads
+    log their exceptions instead of raising them
+    """
+    def __init__(self, errors):
+        super(ErrorCounter, self).__init__(logging.ERROR)
+        self.errors = errors
+
+    def emit(self, record):
+        name = record.exc_info[0].__name__ if record.exc_info else "error"
+        self.errors[name] += 1
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run(args, directory):
+    from cartographer import parsers
+    from cartographer.registry import get_registry
+    from cartographer.signals import bundles_changed
+
+    source = os.path.join(directory, "webpack-stats.json")
+    stop = threading.Event()
+    writer = Writer(source, args.chunks, args.files, args.write_interval,
+                    stop)
+    writer.write_version("atomic")
+    bundles = ["entry-{}".format(chunk) for chunk in range(args.chunks)]
+    common.configure_bundles(source, bundles)
+    parsers.autodiscover()
+
+    publishes = collections.Counter()
+
+    def on_bundles_changed(**kw):
+        publishes["publishes"] += 1
+    bundles_changed.connect(on_bundles_changed, weak=False)
+
+    errors = collections.Counter()
+    counter = ErrorCounter(errors)
+    logger = logging.getLogger("cartographer")
+    logger.addHandler(counter)
+    threads = []
+    reloader = watcher = None
+    if args.reloader == "thread":
+        reloader = Reloader(args.reload_interval, stop, errors)
+        threads.append(reloader)
+    else:
+        from cartographer.utils import updatable_sources_watcher
+        watcher = updatable_sources_watcher()
+    renderers = [Renderer(index, bundles, expected_tags(args.files), stop)
+                 for index in range(args.threads)]
+    threads.extend(renderers)
+    threads.append(writer)
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if watcher is not None:
+        watcher.stop()
+    bundles_changed.disconnect(on_bundles_changed)
+    logger.removeHandler(counter)
+
+    latencies = sorted(latency for renderer in renderers
+                       for latency in renderer.latencies)
+    counts = collections.Counter()
+    for renderer in renderers:
+        counts.update(renderer.counts)
+    return {
+        "threads": args.threads,
+        "duration": elapsed,
+        "renders": counts.pop("renders", 0),
+        "p50": percentile(latencies, 0.50),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1] if latencies else 0.0,
+        "mean": statistics.mean(latencies) if latencies else 0.0,
+        "writes": dict(writer.writes),
+        "reloads": reloader.reloads if reloader is not None else None,
+        "publishes": publishes["publishes"],
+        "generation": get_registry().generation,
+        "torn": counts.pop("torn", 0),
+        "missing bundle": counts.pop("missing bundle", 0),
+        "NotRegisteredAsset": counts.pop("NotRegisteredAsset", 0),
+        "render exceptions": dict(counts),
+        "reload exceptions": dict(errors),
+    }
+
+
+def report(result):
+    duration = result["duration"]
+    print("{threads} render threads, {duration:.1f}s".format(**result))
+    print("renders      {:>10} ({:,.0f}/s)".format(
+        result["renders"], result["renders"] / duration))
+    print("latency      p50 {:.1f}us  p99 {:.1f}us  max {:.1f}ms".format(
+        result["p50"] * 1e6, result["p99"] * 1e6, result["max"] * 1e3))
+    writes = sum(result["writes"].values())
+    print("writes       {:>10} ({})".format(writes, ", ".join(
+        "{} {}".format(mode, count)
+        for mode, count in sorted(result["writes"].items()))))
+    if result["reloads"] is not None:
+        print("reloads      {:>10} ({:,.1f}/s)".format(
+            result["reloads"], result["reloads"] / duration))
+    print("publishes    {:>10} ({:,.1f}/s)".format(
+        result["publishes"], result["publishes"] / duration))
+    failures = 0
+    for key in ("torn", "missing bundle", "NotRegisteredAsset"):
+        failures += result[key]
+        print("{:<12} {:>10}".format(key, result[key]))
+    for key in ("render exceptions", "reload exceptions"):
+        failures += sum(result[key].values())
+        print("{:<18} {}".format(key, ", ".join(
+            "{} {}".format(name, count)
+            for name, count in sorted(result[key].items())) or "0"))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Reload while rendering stress harness")
+    parser.add_argument("--threads", type=int, default=8,
+                        help="Render threads")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Seconds to run")
+    parser.add_argument("--chunks", type=int, default=50)
+    parser.add_argument("--files", type=int, default=10,
+                        help="Files per chunk")
+    parser.add_argument("--write-interval", type=float, default=0.01,
+                        help="Seconds between two writes")
+    parser.add_argument("--reloader", choices=("thread", "watcher"),
+                        default="thread",
+                        help="rediscover() in a loop, or the watcher")
+    parser.add_argument("--reload-interval", type=float, default=0.0,
+                        help="Seconds between two reloads of the thread")
+    parser.add_argument("--watcher", default="auto",
+                        help="WATCHER option with --reloader watcher")
+    parser.add_argument("--json", help="Write the results to this file")
+    args = parser.parse_args()
+
+    common.setup(WATCHER=args.watcher if args.reloader == "watcher"
+                 else None, WATCHER_DELAY=0.0)
+    with tempfile.TemporaryDirectory() as directory:
+        result = run(args, directory)
+    failures = report(result)
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump(result, output, indent=2)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
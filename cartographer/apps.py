@@ -2,8 +2,10 @@
 
 from django.apps import AppConfig
 
+from .conf import get_options
 from .errors import BAD_CONFIG_ERROR
-from .parsers import autodiscover
+from .parsers import autodiscover, FrozenLoader, LazyLoader, warmup
+from .registry import get_registry
 from .utils import updatable_sources_watcher
 
 
@@ -32,5 +34,27 @@ class CartographerConfig(AppConfig):
     def ready(self):
         from django.core.checks import register, Tags
         register(Tags.compatibility)(cartographer_cfg_check)
-        updatable_sources = self.autodiscover()
+        options = get_options()
+        if options['METRICS']:
+            from . import metrics
+            metrics.enable()
+        if options['FROZEN']:
+            # Compiled on deploy, nothing to parse nor to watch
+            registry = get_registry()
+            registry.loader = FrozenLoader(registry,
+                                           options['FROZEN_MANIFEST'])
+            return
+        if options['SHARED']:
+            from .shared import SharedRegistry
+            SharedRegistry(get_registry(), options).start()
+            return
+        registry = get_registry()
+        if options['COMPILING_POLICY'] == 'wait':
+            registry.wait_timeout = options['COMPILING_TIMEOUT']
+        if options['LAZY']:
+            registry.loader = LazyLoader(registry)
+            if options['WARMUP']:
+                warmup(registry)
+        else:
+            self.autodiscover()
         updatable_sources_watcher()
@@ -0,0 +1,81 @@
+#! -*- coding: utf-8 -*-
+"""
+Parsed manifests stored in a django cache
+
+Processes and hosts starting later get the ready-made bundles of a source
+instead of parsing it and resolving every url again. Entries are keyed by
+the source content hash and the bundles configuration, a new build is a
+new key
+"""
+
+import collections
+import hashlib
+import json
+
+from django.conf import settings
+
+from .conf import get_options
+from .registry import Bundle
+from .resolvers import get_resolver
+from .signals import observed, cache_hit, cache_miss
+
+KEY_PREFIX = "cartographer:manifest"
+
+
+def _json_default(value):
+    # Compiled IGNORE patterns
+    return getattr(value, "pattern", str(value))
+
+
+class ManifestCache(object):
+    def __init__(self, alias, timeout=None):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get_key(self, source, parsers):
+        """
+        Key of the bundles of ``parsers`` read from ``source``, None when
+        the source can not be read
+        """
+        try:
+            digest = parsers[0].get_digest()
+        except (OSError, IOError):
+            return None
+        options = get_options()
+        # Urls depend on the static storage manifest too
+        config = json.dumps(
+            [settings.STATIC_URL, get_resolver().get_version(),
+             options['INTEGRITY'], options['INLINE_THRESHOLD']] +
+            [parser.get_settings() for parser in parsers],
+            sort_keys=True, default=_json_default)
+        config = hashlib.sha1(config.encode("utf-8")).hexdigest()
+        return "{}:{}:{}".format(KEY_PREFIX, digest, config)
+
+    def get(self, key):
+        data = self.cache.get(key)
+        if data is None:
+            if observed(cache_miss):
+                cache_miss.send(sender=None, cache="manifest", key=key)
+            return None
+        if observed(cache_hit):
+            cache_hit.send(sender=None, cache="manifest", key=key)
+        bundles = collections.OrderedDict()
+        for bundle_data in data:
+            bundle = Bundle.deserialize(bundle_data)
+            bundles[bundle.name] = bundle
+        return bundles
+
+    def set(self, key, bundles):
+        data = [bundle.serialize() for bundle in bundles.values()]
+        self.cache.set(key, data, self.timeout)
+
+
+def get_manifest_cache():
+    """
+    Configured ManifestCache, None when disabled
+    """
+    options = get_options()
+    if not options['CACHE']:
+        return None
+    return ManifestCache(options['CACHE'], options['CACHE_TIMEOUT'])
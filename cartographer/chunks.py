@@ -0,0 +1,101 @@
+#! -*- coding: utf-8 -*-
+"""
+Shared chunks graph
+
+With webpack splitChunks several entry points list the same runtime and
+vendor files. Every bundle orders its assets, the graph of a snapshot
+holds those orders so the union of any set of bundles is emitted once per
+file, in an order valid for each of them.
+"""
+
+import heapq
+import threading
+
+# Graph of the latest snapshot it was requested for
+_graph = (None, None)
+_graph_lock = threading.Lock()
+
+
+class ChunkGraph(object):
+    """
+    Asset name -> names of the assets following it in some bundle, built
+    once per snapshot generation
+    """
+    def __init__(self, bundles):
+        self.successors = {}
+        for bundle in bundles.values():
+            previous = None
+            for asset in bundle.assets:
+                if previous is not None and previous != asset.name:
+                    self.successors.setdefault(previous, set()).add(
+                        asset.name)
+                previous = asset.name
+
+    def sort(self, names):
+        """
+        Order ``names`` so an asset comes after those preceding it in any
+        bundle, ties keep the given order
+        When bundles disagree on an order the cycle is broken at the first
+        given asset
+        """
+        position = {name: index for index, name in enumerate(names)}
+        indegree = dict.fromkeys(names, 0)
+        for name in names:
+            for successor in self.successors.get(name, ()):
+                if successor in indegree:
+                    indegree[successor] += 1
+        ready = [(position[name], name) for name in names
+                 if not indegree[name]]
+        heapq.heapify(ready)
+        ordered, done = [], set()
+        while len(ordered) < len(names):
+            if not ready:
+                name = next(name for name in names if name not in done)
+                ready.append((position[name], name))
+            _, name = heapq.heappop(ready)
+            if name in done:
+                continue
+            done.add(name)
+            ordered.append(name)
+            for successor in self.successors.get(name, ()):
+                if successor in indegree and successor not in done:
+                    indegree[successor] -= 1
+                    if not indegree[successor]:
+                        heapq.heappush(ready,
+                                       (position[successor], successor))
+        return ordered
+
+    def merge(self, bundles, kind=("",)):
+        """
+        ``(bundle, name, asset)`` of the union of ``bundles`` assets of
+        ``kind``, once per name, rendered with the first bundle listing it
+        Kinds are grouped in the requested order like Bundle.filter_assets
+        """
+        found = {}
+        for bundle in bundles:
+            for asset in bundle.assets:
+                if asset.name not in found:
+                    found[asset.name] = (bundle, asset.name, asset)
+        ordered = [found[name] for name in self.sort(list(found))]
+        items = []
+        for ext in kind:
+            ext = ext.lstrip(".").lower()
+            items.extend(item for item in ordered
+                         if not ext or item[2].kind == ext)
+        return items
+
+
+def get_graph(snapshot):
+    """
+    ChunkGraph of ``snapshot``, built on its first use
+    """
+    global _graph
+    generation, graph = _graph
+    if generation == snapshot.generation:
+        return graph
+    with _graph_lock:
+        generation, graph = _graph
+        if generation != snapshot.generation:
+            graph = ChunkGraph(snapshot.bundles)
+            _graph = (snapshot.generation, graph)
+    return graph
@@ -0,0 +1,19 @@
+#! -*- coding: utf-8 -*-
+"""
+Access to cartographer global options
+"""
+
+from .defaults import DEFAULT_OPTIONS
+
+
+def get_options():
+    """
+    Return DEFAULT_OPTIONS overridden by settings.CARTOGRAPHER_OPTIONS
+    """
+    from django.conf import settings
+    return dict(DEFAULT_OPTIONS,
+                **getattr(settings, 'CARTOGRAPHER_OPTIONS', {}))
+
+
+def get_option(name):
+    return get_options()[name]
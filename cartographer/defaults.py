@@ -13,7 +13,15 @@ DEFAULT_CONFIG = {
         'BUNDLES_DIRNAME': 'webpack_bundles/',
         'SOURCE': 'webpack-stats.json',
         'IGNORE': ['.+\.hot-update.js', '.+\.map']
-    }
+    },
+    "FILE": {
+        'TAG_TEMPLATES': {
+            "js": "cartographer/javascript_tag.html",
+            "css": "cartographer/stylesheet_tag.html",
+        },
+        'BUNDLES_DIRNAME': '',
+        'SOURCE': 'assets.json',
+    },
 }
 
 DEFAULT_BUNDLE_KEYS = {
@@ -21,3 +29,62 @@ DEFAULT_BUNDLE_KEYS = {
 }
 
 UPDATABLE_BUNDLES = frozenset(["WEBPACK"])
+
+# Global options, overridable with settings.CARTOGRAPHER_OPTIONS
+DEFAULT_OPTIONS = {
+    # Watcher backend: "auto", "inotify", "poll", a dotted path or None
+    'WATCHER': 'auto',
+    # Seconds between two checks of the polling watcher
+    'POLL_INTERVAL': 1.0,
+    # Parse a source the first time one of its bundles is used
+    'LAZY': True,
+    # With LAZY, load every bundle from a background thread after startup
+    'WARMUP': False,
+    # Share one registry between the processes of the host, a leader
+    # parses and watches, the others load its snapshot
+    'SHARED': False,
+    # Snapshot path, by default in the temp directory, one per sources set
+    'SHARED_SNAPSHOT': None,
+    # Django cache alias storing parsed manifests, None disables it
+    'CACHE': None,
+    # Timeout of the cached manifests, None uses the cache default
+    'CACHE_TIMEOUT': None,
+    # Load only the precompiled manifest, never parse nor watch sources
+    'FROZEN': False,
+    # Precompiled manifest path, written by "manage.py cartographer_compile"
+    'FROZEN_MANIFEST': 'cartographer-manifest.json',
+    # Seconds a changed source must stay quiet before it is reloaded
+    'WATCHER_DELAY': 0.2,
+    # Stats files of at least this many bytes are streamed, only the
+    # configured chunks are extracted, None always loads the whole file
+    'STREAMING_THRESHOLD': 10 * 1024 * 1024,
+    # Aggregate the cartographer signals in cartographer.metrics
+    'METRICS': False,
+    # Worker processes parsing stats files, the serving process does not
+    # hold the GIL while parsing, 0 parses in the reloading thread
+    'PARSER_PROCESSES': 0,
+    # While webpack writes a stats file the last good bundles are served,
+    # "wait" blocks readers of its bundles until it is done, for at most
+    # COMPILING_TIMEOUT seconds, "last-good" never blocks
+    'COMPILING_POLICY': 'last-good',
+    # Seconds an unfinished stats file is retried (and waited for), with a
+    # backoff doubling from COMPILING_BACKOFF seconds, None never retries
+    'COMPILING_TIMEOUT': 30.0,
+    'COMPILING_BACKOFF': 0.1,
+    # Preload scripts with rel=modulepreload instead of rel=preload
+    'PRELOAD_MODULES': False,
+    # Send 103 Early Hints preloading the bundles of a view, servers
+    # without wsgi.early_hints (gunicorn) ignore it
+    'EARLY_HINTS': False,
+    # Subresource integrity hash algorithm ("sha256", "sha384" or
+    # "sha512") computed once per asset file, None disables it
+    'INTEGRITY': None,
+    # Threads hashing the files of a reload
+    'INTEGRITY_WORKERS': 4,
+    # Scripts and stylesheets smaller than this many bytes are inlined in
+    # the rendered tags, 0 disables it
+    'INLINE_THRESHOLD': 0,
+    # Threads loading independent sources at once, startup takes as long
+    # as the slowest source, 0 loads them one after another
+    'DISCOVERY_WORKERS': 0,
+}
@@ -57,3 +57,17 @@ class AssetMapError(Exception):
 
 class StaticfileAssetNotFound(Exception):
     pass
+
+
+class CartographerDiscoveryError(Exception):
+    """
+    Sources failing to load while discovering them in parallel, the other
+    sources bundles are published anyway
+    """
+    def __init__(self, failures):
+        self.failures = failures
+        super(CartographerDiscoveryError, self).__init__(failures)
+
+    def __str__(self):
+        return "\n".join("{}: {}".format(source, str(error).strip())
+                         for source, error in self.failures.items())
@@ -0,0 +1,140 @@
+#! -*- coding: utf-8 -*-
+"""
+Binary assets manifest, read through mmap
+
+Layout, little endian: MAGIC, version and bundles count as a fixed header,
+then one ENTRY per bundle sorted by name (name offset and length, files
+offset and length) followed by the names and the files blobs. Files of a
+bundle are utf-8 names joined by newlines.
+
+Looking a bundle up is a binary search over the offset table, only its own
+files are decoded. The mapping is read only, processes reading the same
+file share its pages.
+"""
+
+import collections.abc
+import mmap
+import os
+import struct
+
+from .files import write_aside
+
+MAGIC = b"CARTIDX\x00"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+ENTRY = struct.Struct("<QIQI")
+
+# Open indexes, keyed by path, validated against (inode, mtime, size)
+_indexes = {}
+
+
+def is_index(path):
+    """
+    True when ``path`` starts with the binary manifest magic
+    """
+    with open(path, 'rb') as source:
+        return source.read(len(MAGIC)) == MAGIC
+
+
+def write_index(path, bundles):
+    """
+    Write ``bundles``, a mapping of bundle names to file names, see
+    write_aside
+    """
+    entries = sorted((name.encode("utf-8"),
+                      "\n".join(files).encode("utf-8"))
+                     for name, files in bundles.items())
+    table = []
+    name_offset = HEADER.size + ENTRY.size * len(entries)
+    files_offset = name_offset + sum(len(name) for name, _ in entries)
+    for name, files in entries:
+        table.append(ENTRY.pack(name_offset, len(name),
+                                files_offset, len(files)))
+        name_offset += len(name)
+        files_offset += len(files)
+    write_aside(path, [HEADER.pack(MAGIC, VERSION, len(entries)),
+                       b"".join(table),
+                       b"".join(name for name, _ in entries),
+                       b"".join(files for _, files in entries)])
+    return len(entries)
+
+
+class ManifestIndex(collections.abc.Mapping):
+    """
+    Read only mapping of bundle names to file names lists over a mapped
+    binary manifest
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as index:
+            self.map = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.count = HEADER.unpack_from(self.map, 0)
+        except struct.error:
+            raise ValueError("Truncated assets index {}".format(path))
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a version {} assets index {}".format(
+                VERSION, path))
+        # Files blobs are written last, in the table order
+        end = HEADER.size + ENTRY.size * self.count
+        if self.count and len(self.map) >= end:
+            _, _, offset, length = self.entry(self.count - 1)
+            end = offset + length
+        if len(self.map) < end:
+            raise ValueError("Truncated assets index {}".format(path))
+
+    def entry(self, position):
+        return ENTRY.unpack_from(self.map, HEADER.size + ENTRY.size * position)
+
+    def name(self, position):
+        offset, length, _, _ = self.entry(position)
+        return self.map[offset:offset + length]
+
+    def find(self, name):
+        """
+        Position of ``name`` in the offset table, None if missing
+        """
+        key = name.encode("utf-8")
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.name(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self.name(low) == key:
+            return low
+        return None
+
+    def __getitem__(self, name):
+        position = self.find(name)
+        if position is None:
+            raise KeyError(name)
+        _, _, offset, length = self.entry(position)
+        if not length:
+            return []
+        return self.map[offset:offset + length].decode("utf-8").split("\n")
+
+    def __contains__(self, name):
+        return self.find(name) is not None
+
+    def __iter__(self):
+        for position in range(self.count):
+            yield self.name(position).decode("utf-8")
+
+    def __len__(self):
+        return self.count
+
+
+def open_index(path):
+    """
+    ManifestIndex of ``path``, an unchanged file is mapped only once
+    """
+    stat = os.stat(path)
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    cached = _indexes.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    index = ManifestIndex(path)
+    # The replaced mapping is closed once no reader holds it anymore
+    _indexes[path] = (signature, index)
+    return index
@@ -0,0 +1,44 @@
+#! -*- coding: utf-8 -*-
+"""
+File helpers shared by the parsers, the watchers and the files cartographer
+writes (shared snapshots, binary indexes, compiled manifests)
+"""
+
+import hashlib
+import os
+import tempfile
+
+BLOCKSIZE = 1 << 16
+
+
+def hash_file(path, blocksize=BLOCKSIZE):
+    """
+    sha1 hex digest of the file content, raises OSError
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(blocksize), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_aside(path, chunks):
+    """
+    Write the ``chunks`` bytes to ``path`` through a uniquely named file of
+    its directory then renamed, readers never see half a file and
+    concurrent writers never share a temporary file
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".cartographer")
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,142 @@
+#! -*- coding: utf-8 -*-
+"""
+Subresource integrity hashes and inlined contents of the asset files
+
+Computed when bundles are built from the files as they are served, an
+unchanged file is never read twice.
+Large batches are hashed by a thread pool, hashlib releases the GIL while
+hashing so files are hashed in parallel.
+"""
+
+import base64
+import concurrent.futures
+import hashlib
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import ImproperlyConfigured
+
+BLOCKSIZE = 1 << 20
+# Below this many files the pool costs more than it saves
+POOL_THRESHOLD = 8
+# Closing tags which would end an inlined content early, by asset kind
+CLOSING_TAGS = {"js": "</script", "css": "</style"}
+
+# Digested files, keyed by path, validated against (mtime, size)
+_files_cache = {}
+
+
+def escape_content(content, kind):
+    """
+    Make ``content`` safe to be inlined in a tag of its ``kind``
+    """
+    closing = CLOSING_TAGS.get(kind)
+    if closing is None or closing not in content.lower():
+        return content
+    parts, lowered, start = [], content.lower(), 0
+    position = lowered.find(closing)
+    while position != -1:
+        parts.append(content[start:position + 1])
+        parts.append("\\")
+        start = position + 1
+        position = lowered.find(closing, start)
+    parts.append(content[start:])
+    return "".join(parts)
+
+
+def find_stored(path):
+    """
+    Path of the file collectstatic stored for ``path``, post processed
+    (urls rewritten) and renamed by manifest storages, None when it is not
+    collected or the storage is not local
+    """
+    stored_name = getattr(staticfiles_storage, "stored_name", None)
+    try:
+        name = stored_name(path) if stored_name is not None else path
+        found = staticfiles_storage.path(name)
+    except (ValueError, NotImplementedError, ImproperlyConfigured):
+        # Missing from the manifest, remote storage or no STATIC_ROOT
+        return None
+    return found if os.path.isfile(found) else None
+
+
+def find_file(path, source=None):
+    """
+    Filesystem path of the static file ``path`` as it is served, the
+    stored one unless DEBUG serves the files found by the finders, else
+    the webpack ``source`` path or the finders result, None when not found
+    """
+    if not settings.DEBUG:
+        found = find_stored(path)
+        if found is not None:
+            return found
+    if source and os.path.isfile(source):
+        return source
+    return finders.find(path) or None
+
+
+def digest_file(path, algorithm=None, threshold=0):
+    """
+    Return ``(integrity, content)`` of the file at ``path``, integrity
+    when an ``algorithm`` is given, content when smaller than ``threshold``
+    bytes and utf-8, ``(None, None)`` for missing files
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None, None
+    signature = (stat.st_mtime_ns, stat.st_size, algorithm, threshold)
+    cached = _files_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    digest = hashlib.new(algorithm) if algorithm else None
+    inline = bool(threshold) and stat.st_size < threshold
+    if digest is None and not inline:
+        return None, None
+    blocks = []
+    try:
+        with open(path, 'rb') as asset:
+            for block in iter(lambda: asset.read(BLOCKSIZE), b''):
+                if digest is not None:
+                    digest.update(block)
+                if inline:
+                    blocks.append(block)
+    except OSError:
+        return None, None
+    integrity = content = None
+    if digest is not None:
+        integrity = "{}-{}".format(
+            algorithm, base64.b64encode(digest.digest()).decode("ascii"))
+    if inline:
+        try:
+            content = b"".join(blocks).decode("utf-8")
+        except UnicodeDecodeError:
+            content = None
+    _files_cache[path] = (signature, (integrity, content))
+    return integrity, content
+
+
+def prune_files(paths):
+    """
+    Forget the digests and contents of files not in ``paths``
+    """
+    global _files_cache
+    # Digests may be added meanwhile, iterate an atomic copy
+    _files_cache = {path: cached for path, cached in
+                    _files_cache.copy().items() if path in paths}
+
+
+def digest_files(paths, algorithm=None, threshold=0, workers=1):
+    """
+    Map every path of ``paths`` to its ``digest_file`` result, hashed by
+    ``workers`` threads for large batches
+    """
+    paths = [path for path in dict.fromkeys(paths) if path]
+    if workers > 1 and len(paths) >= POOL_THRESHOLD:
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            results = pool.map(
+                lambda path: digest_file(path, algorithm, threshold), paths)
+            return dict(zip(paths, results))
+    return {path: digest_file(path, algorithm, threshold) for path in paths}
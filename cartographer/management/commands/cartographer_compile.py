@@ -0,0 +1,41 @@
+#! -*- coding: utf-8 -*-
+"""
+Compile the assets registry into a manifest loadable in FROZEN mode
+"""
+
+import collections
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cartographer.cache import get_manifest_cache
+from cartographer.conf import get_options
+from cartographer.files import write_aside
+from cartographer.parsers import get_parsers, group_by_source, load_source
+from cartographer.registry import AssetManifestRegistry
+
+
+class Command(BaseCommand):
+    help = "Compile the assets registry for the FROZEN mode"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', default=None,
+            help="Manifest path, defaults to the FROZEN_MANIFEST option")
+
+    def handle(self, *args, **options):
+        output = options['output'] or get_options()['FROZEN_MANIFEST']
+        # Only the configured sources, never what the process registry
+        # holds (a previous manifest, bundles removed since)
+        bundles = collections.OrderedDict()
+        cache = get_manifest_cache()
+        for source, parsers in group_by_source(get_parsers()).items():
+            loaded, state = load_source(source, parsers, cache)
+            if state.status != "done":
+                raise CommandError("{} is {}, run it again once webpack is "
+                                   "done".format(source, state.status))
+            bundles.update(loaded)
+        registry = AssetManifestRegistry(bundles)
+        # A running worker never reads half a file
+        write_aside(output, [registry.serialize_json().encode("utf-8")])
+        self.stdout.write("Compiled {} bundles into {}".format(
+            len(registry), output))
@@ -0,0 +1,33 @@
+#! -*- coding: utf-8 -*-
+"""
+Convert a json assets file into the binary index read by the FILE origin
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cartographer.fileindex import write_index
+
+
+class Command(BaseCommand):
+    help = "Write the binary index of a json assets file"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source', help='Json assets file, {"bundles": {name: [files]}}')
+        parser.add_argument(
+            '--output', default=None,
+            help="Index path, defaults to the source path with .idx")
+
+    def handle(self, *args, **options):
+        source = options['source']
+        output = options['output'] or "{}.idx".format(
+            source[:-5] if source.endswith(".json") else source)
+        try:
+            with open(source, 'r', encoding="utf-8") as assets:
+                bundles = json.load(assets)["bundles"]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            raise CommandError("Can not read {}: {}".format(source, e))
+        count = write_index(output, bundles)
+        self.stdout.write("Indexed {} bundles into {}".format(count, output))
@@ -0,0 +1,101 @@
+#! -*- coding: utf-8 -*-
+"""
+Lightweight metrics aggregated from the cartographer signals
+
+Nothing is collected until ``enable()`` connects the receivers
+
+    from cartographer import metrics
+    metrics.enable()
+    ...
+    metrics.get_metrics().snapshot()
+"""
+
+import collections
+import threading
+
+from . import signals
+
+
+class Metrics(object):
+    """
+    Counters and accumulated durations, safe to update from any thread
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+
+    def add(self, **values):
+        with self.lock:
+            self.counters.update(values)
+
+    def snapshot(self):
+        """
+        Current values, with derived ratios
+        """
+        with self.lock:
+            data = dict(self.counters)
+        events = data.get("watcher_events", 0)
+        if events:
+            data["reloads_per_event"] = data.get("reloads", 0) / events
+        for cache in ("fragments", "manifest", "stats"):
+            hits = data.get("{}_hits".format(cache), 0)
+            total = hits + data.get("{}_misses".format(cache), 0)
+            if total:
+                data["{}_hit_ratio".format(cache)] = hits / total
+        return data
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+
+    # Receivers
+    def on_parse_finished(self, duration, bytes_read, **kw):
+        self.add(parses=1, parse_seconds=duration, bytes_read=bytes_read)
+
+    def on_reload_triggered(self, sources, events, **kw):
+        self.add(reloads=1, watcher_events=events,
+                 reloaded_sources=len(sources))
+
+    def on_bundles_changed(self, bundles, removed, **kw):
+        self.add(publishes=1, bundles_changed=len(bundles) + len(removed))
+
+    def on_bundle_rendered(self, duration, cached, **kw):
+        self.add(renders=1, render_seconds=duration)
+
+    def on_cache_hit(self, cache, **kw):
+        self.add(**{"{}_hits".format(cache): 1})
+
+    def on_cache_miss(self, cache, **kw):
+        self.add(**{"{}_misses".format(cache): 1})
+
+    def get_receivers(self):
+        return (
+            (signals.parse_finished, self.on_parse_finished),
+            (signals.reload_triggered, self.on_reload_triggered),
+            (signals.bundles_changed, self.on_bundles_changed),
+            (signals.bundle_rendered, self.on_bundle_rendered),
+            (signals.cache_hit, self.on_cache_hit),
+            (signals.cache_miss, self.on_cache_miss),
+        )
+
+    def connect(self):
+        for signal, receiver in self.get_receivers():
+            signal.connect(receiver, dispatch_uid=(id(self), signal))
+
+    def disconnect(self):
+        for signal, receiver in self.get_receivers():
+            signal.disconnect(dispatch_uid=(id(self), signal))
+
+metrics = Metrics()
+
+
+def get_metrics():
+    return metrics
+
+
+def enable():
+    metrics.connect()
+
+
+def disable():
+    metrics.disconnect()
@@ -1,21 +1,133 @@
 #! -*- coding: utf-8 -*-
 
+import atexit
+import collections
+import concurrent.futures
+import contextlib
 import json
+import logging
+import multiprocessing
 import time
 import os
 import re
+import threading
 
-from django.conf import settings
-from django.contrib.staticfiles.storage import staticfiles_storage
+from asgiref.sync import sync_to_async
 
-from .registry import get_registry, Bundle
+from .cache import get_manifest_cache
+from .conf import get_option
+from .registry import get_registry, get_kind, Asset, Bundle, SourceState
+from .resolvers import get_resolver
+from .signals import (observed, cache_hit, cache_miss, parse_started,
+                      parse_finished)
 from .defaults import DEFAULT_CONFIG, DEFAULT_BUNDLE_KEYS, UPDATABLE_BUNDLES
-from .errors import CartographerWebpackStatsError, CartographerConfigError
+from .fileindex import is_index, open_index
+from .files import hash_file
+from .integrity import (CLOSING_TAGS, escape_content, digest_files,
+                        find_file, prune_files)
+from .errors import (CartographerWebpackStatsError, CartographerConfigError,
+                     CartographerDiscoveryError)
+from .streaming import read_stats
+
+logger = logging.getLogger(__name__)
+
+# Parsed stats documents, keyed by path, validated against (mtime, size)
+_stats_cache = {}
+# Content hashes, same keys and validation
+_digests_cache = {}
+# See get_process_pool
+_process_pool = None
+_process_pool_lock = threading.Lock()
+# Static paths and digested files of the latest load of every source,
+# see prune_caches
+_resolved_paths = {}
+_digested_paths = {}
+# Reload lock of every source, see source_locks
+_source_locks = collections.defaultdict(threading.RLock)
+_source_locks_lock = threading.Lock()
+
+
+def get_digest(path):
+    """
+    Content hash of a source, an unchanged file is never hashed twice
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _digests_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    digest = hash_file(path)
+    _digests_cache[path] = (signature, digest)
+    return digest
+
+
+def get_process_pool():
+    """
+    Worker processes parsing stats files when PARSER_PROCESSES is set, the
+    GIL of the serving process is not held while webpack rebuilds
+    Workers are spawned, the pool is created from the watcher or retry
+    threads of a running server, forking it could copy a held lock
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = concurrent.futures.ProcessPoolExecutor(
+                get_option('PARSER_PROCESSES'),
+                mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_process_pool.shutdown)
+        return _process_pool
 
-try:
-    _cartographer_cfg = getattr(settings, "CARTOGRAPHER")
-except Exception as e:
-    raise CartographerConfigError(e)
+
+def load_stats(path, chunks=None):
+    """
+    Load a json stats file, an unchanged file is never parsed twice
+    None when it can not be decoded, likely being written
+    When ``chunks`` is given only the status keys and those chunks are
+    kept (and memoized), files over STREAMING_THRESHOLD bytes are streamed
+    instead of decoded whole
+    With PARSER_PROCESSES and ``chunks`` the file is read by a worker
+    process which sends back only those chunks
+    """
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    threshold = get_option('STREAMING_THRESHOLD')
+    stream = not (chunks is None or threshold is None or
+                  stat.st_size < threshold)
+    isolated = chunks is not None and bool(get_option('PARSER_PROCESSES'))
+    chunks = frozenset(chunks) if chunks is not None else None
+    cached = _stats_cache.get(path)
+    if cached is not None and cached[0] == signature and (
+            cached[1] is None or chunks is not None and chunks <= cached[1]):
+        if observed(cache_hit):
+            cache_hit.send(sender=None, cache="stats", key=path)
+        return cached[2]
+    if observed(cache_miss):
+        cache_miss.send(sender=None, cache="stats", key=path)
+    if observed(parse_started):
+        parse_started.send(sender=None, source=path)
+    started = time.perf_counter()
+    try:
+        if isolated:
+            document = get_process_pool().submit(
+                read_stats, path, chunks, stream).result()
+        elif chunks is not None:
+            # Verbose keys (modules, assets) are not kept alive
+            document = read_stats(path, chunks, stream)
+        else:
+            with open(path, 'r', encoding="utf-8") as json_file:
+                document = json.load(json_file)
+    except ValueError:
+        # The file can be unreadable here due to reloading, json will
+        # throw errors, remembered until the file changes again
+        _stats_cache[path] = (signature, None, None)
+        return None
+    _stats_cache[path] = (signature, chunks, document)
+    if observed(parse_finished):
+        # Streamed files are read up to the end too
+        parse_finished.send(sender=None, source=path,
+                            duration=time.perf_counter() - started,
+                            bytes_read=stat.st_size)
+    return document
 
 
 class AssetsParser(object):
@@ -24,12 +136,16 @@ class AssetsParser(object):
         self.updatable = self.origin in UPDATABLE_BUNDLES
         self.registry = get_registry()
         self.name = name
+        # Static paths resolved and files digested by this load, see
+        # prune_caches
+        self.static_paths = []
+        self.file_paths = []
         for prop in DEFAULT_BUNDLE_KEYS.get(self.origin):
             self._merge_cfg(self.name, prop)
 
     def _merge_cfg(self, bundle, prop):
         prop = prop.upper()
-        bundle_cfg = _cartographer_cfg[self.origin].get(bundle, None)
+        bundle_cfg = get_config()[self.origin].get(bundle, None)
         if not bundle_cfg:
             setattr(self, prop, DEFAULT_CONFIG[self.origin][prop])
         setattr(self, prop, bundle_cfg.get(prop, DEFAULT_CONFIG[self.origin][prop]))
@@ -41,13 +157,74 @@ class AssetsParser(object):
         """
         raise NotImplementedError
 
-    def parse(self):
+    def get_settings(self):
+        """
+        Merged configuration of the bundle
+        """
+        settings = {prop.upper(): getattr(self, prop.upper())
+                    for prop in DEFAULT_BUNDLE_KEYS.get(self.origin)}
+        settings["name"] = self.name
+        return settings
+
+    def get_digest(self):
+        """
+        Content hash of the origin
+        """
+        return get_digest(self.get_origin())
+
+    def create_assets(self, names, paths=None):
+        """
+        Asset records of the files ``names``, urls are resolved in one batch
+        With INTEGRITY or INLINE_THRESHOLD the files as served (see
+        find_file) are digested in one batch too
+        """
+        static_paths = [os.path.join(self.BUNDLES_DIRNAME, name)
+                        for name in names]
+        urls = get_resolver().resolve_many(static_paths)
+        self.static_paths.extend(static_paths)
+        algorithm = get_option('INTEGRITY')
+        threshold = get_option('INLINE_THRESHOLD')
+        if not algorithm and not threshold:
+            return [Asset.create(name, url) for name, url in zip(names, urls)]
+        paths = [find_file(static_path, path) for path, static_path in
+                 zip(paths or [None] * len(names), static_paths)]
+        digests = digest_files(paths, algorithm, threshold,
+                               get_option('INTEGRITY_WORKERS'))
+        self.file_paths.extend(path for path in paths if path)
+        assets = []
+        for name, url, path in zip(names, urls, paths):
+            kind = get_kind(name)
+            integrity, content = digests.get(path, (None, None))
+            if content is not None:
+                content = escape_content(content, kind) \
+                    if kind in CLOSING_TAGS else None
+            assets.append(Asset.create(name, url, kind, integrity, content))
+        return assets
+
+    def build_bundle(self, name, assets, **settings):
+        """
+        Bundle ``name`` of ``assets``, the published one when it is equal,
+        unchanged bundles are not built again (templates, index) on reload
+        """
+        current = self.registry.snapshot.bundles.get(name)
+        if current is not None and current.matches(assets, **settings):
+            return current
+        return Bundle(assets, name=name, **settings)
+
+    def get_status(self, source):
+        """
+        Status of a loaded source: "done", "compiling" or "unreadable",
+        bundles are only built from sources which are not being written
+        """
+        return "unreadable" if source is None else "done"
+
+    def parse(self, source=None):
         """
         Main action, expects subclasses override 'update'
+        An already loaded source can be given to avoid reading it again
+        Returns the built bundles, publishing them is up to the caller
         """
-        self.update()
-        if self.updatable:
-            return self.get_origin()
+        return self.update(source)
 
     def deserialize(self):
         """
@@ -56,9 +233,10 @@ class AssetsParser(object):
         """
         raise NotImplementedError()
 
-    def update(self):
+    def update(self, source=None):
         """
-        Method adapting bundles/assets sources to registry
+        Method adapting bundles/assets sources to registry, must return
+        a dictionary of fully built bundles by name
         """
         raise NotImplementedError()
 
@@ -66,11 +244,57 @@ class AssetsParser(object):
 class AssetsParserFile(AssetsParser):
     """
     Assets parser from file
+    The file maps bundle names to their files, either json
+    ``{"bundles": {"main": ["main.js", "main.css"]}}`` or the binary index
+    written by ``manage.py cartographer_index``
     """
     origin = "FILE"
 
-    def __init__(self, *args, **kw):
-        raise NotImplementedError("TOBEDONE :)")
+    def get_origin(self):
+        """
+        Return the origin parseable source
+        """
+        return self.SOURCE
+
+    def get_source(self, chunks=None):
+        """
+        Mapping of bundle names to files, binary indexes are mapped and
+        looked up without decoding the other bundles
+        """
+        try:
+            if is_index(self.SOURCE):
+                return open_index(self.SOURCE)
+            document = load_stats(self.SOURCE)
+        except IOError:
+            raise IOError('Error reading {}. Are you sure the assets file '
+                          'exists and the path is correct?'.format(
+                              self.SOURCE))
+        except ValueError:
+            return None
+        if document is None:
+            return None
+        try:
+            return document["bundles"]
+        except (KeyError, TypeError):
+            raise CartographerConfigError(
+                "{} does not map bundles to files".format(self.SOURCE))
+
+    def update(self, source=None):
+        """
+        Builds the bundle from specified source
+        """
+        manifest = self.get_source() if source is None else source
+        try:
+            files = manifest[self.name]
+        except KeyError:
+            return {}
+        return {self.name: self.build_bundle(
+            self.name,
+            self.create_assets(files),
+            ORIGIN=self.origin,
+            BUNDLES_DIRNAME=self.BUNDLES_DIRNAME,
+            SOURCE=self.SOURCE,
+            TAG_TEMPLATES=self.TAG_TEMPLATES)}
 
 
 class AssetsParserWebpackStats(AssetsParser):
@@ -90,88 +314,75 @@ class AssetsParserWebpackStats(AssetsParser):
         """
         return self.SOURCE
 
-    def get_source(self):
+    def get_source(self, chunks=None):
         """
         Webpack stats returns a json with a minimin structure
         # TODO: document structure
+        Large files are streamed when the needed ``chunks`` are given
         """
         try:
-            with open(self.SOURCE, 'r', encoding="utf-8") as json_file:
-                try:
-                    return json.load(json_file)
-                except ValueError:
-                    # The file can be unreadable here
-                    # due to reloading, json will throw errors
-                    return None
+            return load_stats(self.SOURCE, chunks)
         except IOError:
             raise IOError('Error reading {}. Are you sure webpack has \
                 generated the file and the path is \
-                correct?'.format(self.STATS_FILE))
+                correct?'.format(self.SOURCE))
 
     def filter_files(self, chunk):
         """
-        webpack default config IGNORE
+        webpack default config IGNORE, see create_assets
+        """
+        files = [_file for _file in chunk
+                 if not any(regex.match(_file["name"])
+                            for regex in self.IGNORE)]
+        return self.create_assets([_file["name"] for _file in files],
+                                  [_file.get("path") for _file in files])
+
+    def get_status(self, source):
+        """
+        Status written by webpack-bundle-tracker
         """
-        for _file in chunk:
-            filename = _file["name"]
-            ignore = any(regex.match(filename) for regex in self.IGNORE)
-            if not ignore:
-                realpath = os.path.join(self.BUNDLES_DIRNAME, filename)
-                _file["url"] = staticfiles_storage.url(realpath)
-                yield _file
+        if not isinstance(source, dict):
+            return "unreadable"
+        return source.get('status') or "unreadable"
 
     def _iter_chunks(self, manifest):
-        for chunk in manifest:
-            if chunk == self.name:
-                yield chunk, manifest[chunk]
+        if self.name in manifest:
+            yield self.name, manifest[self.name]
 
-    def update(self):
+    def update(self, source=None):
         """
-        Creates/Updates the registry from specified source
+        Builds the bundles from specified source
         """
-        json_manifest = self.get_source()
+        json_manifest = self.get_source() if source is None else source
         try:
             status = json_manifest.get('status', None)
         except AttributeError:
             status = None
 
-        # Since webpack origin is updatable and now supoprt
-        # inotify just will wait to receive the file update
+        # Webpack is still writing, the last good bundles are kept and
+        # the source is reloaded once done, see load_source
         if status is None or status == "compiling":
-            return
-
-        # TODO: support timeouts
-        #
-        # while status == 'compiling':
-        #     time.sleep(self.poll_delay)
-        #     json_manifest = self.get_source()
-        #     status = json_manifest.get('status')
+            return {}
 
         if status == 'done':
+            bundles = {}
             chunks = json_manifest['chunks']
             for chunk_name, chunk in self._iter_chunks(chunks):
-                bundle = Bundle(name=chunk_name,
-                                ORIGIN=self.origin,
-                                IGNORE=self.IGNORE,
-                                BUNDLES_DIRNAME=self.BUNDLES_DIRNAME,
-                                SOURCE=self.SOURCE,
-                                TAG_TEMPLATES=self.TAG_TEMPLATES)
-
-                self.registry[chunk_name] = bundle
-                for _file in self.filter_files(chunk):
-                    asset_name = _file["name"]
-                    asset_value = _file
-                    bundle[asset_name] = asset_value
-
-            return
+                bundles[chunk_name] = self.build_bundle(
+                    chunk_name,
+                    self.filter_files(chunk),
+                    ORIGIN=self.origin,
+                    IGNORE=self.IGNORE,
+                    BUNDLES_DIRNAME=self.BUNDLES_DIRNAME,
+                    SOURCE=self.SOURCE,
+                    TAG_TEMPLATES=self.TAG_TEMPLATES)
+            return bundles
 
         elif status == 'error':
-            if 'file' not in json_manifest:
-                json_manifest['file'] = ''
             error = """
             {error} in {file}
             {message}
-            """.format(**json_manifest)
+            """.format(**dict({'file': ''}, **json_manifest))
             raise CartographerWebpackStatsError(error)
 
         raise CartographerWebpackStatsError(
@@ -182,13 +393,18 @@ class AssetsParserWebpackStats(AssetsParser):
 
 def get_config():
     """
+    Read on demand, importing cartographer never touches the settings
     """
     from django.conf import settings
-    return getattr(settings, 'CARTOGRAPHER', {})
+    try:
+        return getattr(settings, 'CARTOGRAPHER', {})
+    except Exception as e:
+        raise CartographerConfigError(e)
 
 
-def autodiscover(updatables=False):
+def get_parsers(updatables=False):
     """
+    Yield a parser for every configured bundle
     """
     user_config = get_config()
     for config_source, config_block in user_config.items():
@@ -196,10 +412,281 @@ def autodiscover(updatables=False):
             continue
         if config_source == "WEBPACK":
             for bundle_name in config_block:
-                AssetsParserWebpackStats(bundle_name).parse()
+                yield AssetsParserWebpackStats(bundle_name)
+        elif config_source == "FILE":
+            for bundle_name in config_block:
+                yield AssetsParserFile(bundle_name)
+
+
+def group_by_source(parsers):
+    """
+    Group parsers sharing the same source, keeping configuration order
+    """
+    groups = collections.OrderedDict()
+    for parser in parsers:
+        groups.setdefault(parser.get_origin(), []).append(parser)
+    return groups
+
+
+class Retrier(object):
+    """
+    Reload unsettled sources off the request path, with an exponential
+    backoff from COMPILING_BACKOFF seconds, until settled or for at most
+    COMPILING_TIMEOUT seconds, the watcher does not need to see the write
+    """
+    max_delay = 2.0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timers = {}
+        self.delays = {}
+
+    def schedule(self, source, state):
+        timeout = get_option('COMPILING_TIMEOUT')
+        with self.lock:
+            if state.settled:
+                self.delays.pop(source, None)
+                return
+            if source in self.timers or timeout is None:
+                return
+            delay = self.delays.get(source, get_option('COMPILING_BACKOFF'))
+            # Unsettled since the registry first recorded it, not since
+            # this load
+            since = (get_registry().get_state(source) or state).since
+            if time.time() + delay > since + timeout:
+                # Given up, left to the watcher
+                self.delays.pop(source, None)
+                return
+            self.delays[source] = min(delay * 2, self.max_delay)
+            timer = threading.Timer(delay, self.retry, [source])
+            timer.daemon = True
+            self.timers[source] = timer
+            timer.start()
+
+    def retry(self, source):
+        with self.lock:
+            del self.timers[source]
+        try:
+            autodiscover(True, [source])
+        except Exception:
+            logger.exception("Error reloading %s", source)
+
+    def cancel(self):
+        with self.lock:
+            for timer in self.timers.values():
+                timer.cancel()
+            self.timers, self.delays = {}, {}
+
+retrier = Retrier()
+
+
+@contextlib.contextmanager
+def source_locks(sources):
+    """
+    Hold the reload locks of ``sources``: watchers, retries and the lazy
+    loader reload a source one at a time, an older read never publishes
+    over a newer one (the last reload reads the file last)
+    Locks are taken in order, reloads of overlapping sources never
+    deadlock, they are reentrant for signal receivers reloading again
+    """
+    with _source_locks_lock:
+        locks = [_source_locks[source] for source in
+                 sorted({os.path.abspath(source) for source in sources})]
+    with contextlib.ExitStack() as stack:
+        for lock in locks:
+            stack.enter_context(lock)
+        yield
+
+
+def prune_caches(source, parsers):
+    """
+    Forget what was memoized for the files of previous builds, webpack
+    --watch names every build differently and storages without a manifest
+    never invalidate urls, only paths used by the latest load of a source
+    are kept
+    """
+    _resolved_paths[source] = frozenset(
+        path for parser in parsers for path in parser.static_paths)
+    get_resolver().prune(frozenset().union(*_resolved_paths.values()))
+    _digested_paths[source] = frozenset(
+        path for parser in parsers for path in parser.file_paths)
+    prune_files(frozenset().union(*_digested_paths.values()))
+
+
+def load_source(source, parsers, cache=None):
+    """
+    Build the bundles of ``parsers``, all read from ``source``, and the
+    SourceState of ``source``
+    """
+    key = cache.get_key(source, parsers) if cache is not None else None
+    if key is not None:
+        bundles = cache.get(key)
+        if bundles is not None:
+            return bundles, SourceState.create("done")
+    bundles = collections.OrderedDict()
+    document = parsers[0].get_source(
+        chunks=[parser.name for parser in parsers])
+    status = parsers[0].get_status(document)
+    if status in ("compiling", "unreadable"):
+        # Being written, keep the last good bundles
+        return bundles, SourceState.create(status)
+    try:
+        for parser in parsers:
+            bundles.update(parser.parse(document))
+    except CartographerWebpackStatsError as e:
+        get_registry().set_states(
+            {source: SourceState.create("error", str(e))})
+        raise
+    if key is not None:
+        cache.set(key, bundles)
+    prune_caches(source, parsers)
+    return bundles, SourceState.create("done")
+
+
+def load_sources(groups, cache=None):
+    """
+    Load every ``(source, parsers)`` of ``groups`` on a pool of
+    DISCOVERY_WORKERS threads, results and failures are in ``groups``
+    order whichever source finishes first
+    """
+    workers = min(get_option('DISCOVERY_WORKERS'), len(groups))
+    with concurrent.futures.ThreadPoolExecutor(
+            workers, thread_name_prefix="cartographer-discovery") as pool:
+        futures = [(source, pool.submit(load_source, source, parsers, cache))
+                   for source, parsers in groups]
+        results, failures = [], collections.OrderedDict()
+        for source, future in futures:
+            try:
+                results.append((source, future.result()))
+            except Exception as e:
+                failures[source] = e
+    return results, failures
+
+
+def autodiscover(updatables=False, sources=None):
+    """
+    Populate the registry, every source is read once for all its bundles
+    The new bundles are built aside and published at once, readers never
+    see a partial reload
+    When ``sources`` is given only bundles read from them are loaded
+    With DISCOVERY_WORKERS sources are loaded in parallel, a failing source
+    does not prevent the others from being published, failures are raised
+    afterwards in a CartographerDiscoveryError
+    """
+    if sources is not None:
+        sources = {os.path.abspath(source) for source in sources}
+    bundles = collections.OrderedDict()
+    states = {}
+    cache = get_manifest_cache()
+    groups = [(source, parsers) for source, parsers in
+              group_by_source(get_parsers(updatables)).items()
+              if sources is None or os.path.abspath(source) in sources]
+    failures = {}
+    with source_locks(source for source, _ in groups):
+        if get_option('DISCOVERY_WORKERS') and len(groups) > 1:
+            results, failures = load_sources(groups, cache)
+            for source, (loaded, states[source]) in results:
+                bundles.update(loaded)
+            for source, error in failures.items():
+                states[source] = SourceState.create("error", str(error))
+        else:
+            for source, parsers in groups:
+                loaded, states[source] = load_source(source, parsers, cache)
+                bundles.update(loaded)
+        if bundles:
+            get_registry().publish(bundles, states=states)
+        elif states:
+            # Nothing new to serve, cached fragments stay valid
+            get_registry().set_states(states)
+    for source, state in states.items():
+        retrier.schedule(source, state)
+    if failures:
+        raise CartographerDiscoveryError(failures)
+    return bundles
+
+
+def get_sources(updatables=False):
+    """
+    Configured sources, the registry does not need to be populated
+    """
+    return list(group_by_source(get_parsers(updatables)))
+
+
+class LazyLoader(object):
+    """
+    Registry loader, a source is parsed the first time one of its
+    bundles is requested, ``None`` requests every pending source
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.lock = threading.Lock()
+        self.pending = None
+
+    def __call__(self, bundle=None):
+        with self.lock:
+            if self.pending is None:
+                self.pending = collections.OrderedDict(
+                    (source, {parser.name for parser in parsers})
+                    for source, parsers in
+                    group_by_source(get_parsers()).items())
+            sources = [source for source, names in self.pending.items()
+                       if bundle is None or bundle in names]
+            if sources:
+                autodiscover(sources=sources)
+            for source in sources:
+                # Loaded, from now on the watcher keeps it updated
+                del self.pending[source]
+            if not self.pending and self.registry.loader is self:
+                self.registry.loader = None
+
+
+class FrozenLoader(object):
+    """
+    Registry loader of a manifest compiled by cartographer_compile, read
+    the first time a bundle is requested, commands which do not render
+    bundles (cartographer_compile itself) run before it exists
+    """
+    def __init__(self, registry, path):
+        self.registry = registry
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, bundle=None):
+        with self.lock:
+            if self.registry.loader is self:
+                load_frozen(self.path)
+                self.registry.loader = None
+
+
+def warmup(registry):
+    """
+    Load every pending bundle from a background thread
+    """
+    thread = threading.Thread(target=registry.ensure_loaded,
+                              name="cartographer-warmup")
+    thread.daemon = True
+    thread.start()
+    return thread
+
+
+def rediscover(sources=None):
+    """
+    Reload updatable bundles, only those read from ``sources`` if given
+    """
+    return autodiscover(True, sources)
+
+
+async def arediscover(sources=None):
+    """
+    Awaitable ``rediscover``, runs in a worker thread and the new bundles
+    are published at once, the event loop keeps serving the previous ones
+    """
+    return await sync_to_async(rediscover, thread_sensitive=False)(sources)
 
 
-def rediscover():
+def load_frozen(path):
     """
+    Populate the registry from a manifest compiled by cartographer_compile
     """
-    autodiscover(True)
+    with open(path, 'r', encoding="utf-8") as frozen:
+        return get_registry().load_json(frozen.read())
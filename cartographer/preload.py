@@ -0,0 +1,138 @@
+#! -*- coding: utf-8 -*-
+"""
+Link preload headers and 103 Early Hints
+
+Bundles rendered while a response is built are collected, the response gets
+a Link header preloading their assets. Header values are built with the
+bundles, see Bundle.build_links.
+
+Early hints are sent through the ``wsgi.early_hints`` callable of servers
+implementing it (gunicorn), ignored elsewhere.
+"""
+
+import functools
+import inspect
+
+from .conf import get_option
+from .registry import get_registry
+from .tagsmanager import normalize_kind, rendered_bundles
+
+
+def get_links(used):
+    """
+    Link header values of the ``(name, kind)`` pairs, without duplicates,
+    unknown bundles are skipped
+    """
+    bundles = get_registry().snapshot.bundles
+    links = {}
+    for name, kind in used:
+        bundle = bundles.get(name)
+        if bundle is not None:
+            links.update(dict.fromkeys(bundle.get_links(kind)))
+    return list(links)
+
+
+def add_link_header(response, used):
+    """
+    Add the preload links of ``used`` to ``response``
+    """
+    links = get_links(used)
+    if not links:
+        return response
+    if response.has_header("Link"):
+        links.insert(0, response["Link"])
+    response["Link"] = ", ".join(links)
+    return response
+
+
+def send_early_hints(request, used):
+    """
+    Send a 103 response preloading ``used``, False if the server can not
+    """
+    early_hints = request.META.get("wsgi.early_hints")
+    if early_hints is None:
+        return False
+    links = get_links(used)
+    if links:
+        early_hints([("Link", ", ".join(links))])
+    return True
+
+
+class PreloadMiddleware(object):
+    """
+    Link preload headers for the bundles rendered by every response
+    With the EARLY_HINTS option, the bundles a view rendered last time are
+    hinted before the view runs again
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.early_hints = get_option('EARLY_HINTS')
+        # View -> bundles it rendered last time
+        self.learned = {}
+
+    def __call__(self, request):
+        used = []
+        token = rendered_bundles.set(used)
+        try:
+            response = self.get_response(request)
+        finally:
+            rendered_bundles.reset(token)
+        view = getattr(request, "cartographer_view", None)
+        if view is not None:
+            self.learned[view] = tuple(dict.fromkeys(used))
+        return add_link_header(response, used)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if self.early_hints:
+            request.cartographer_view = view_func
+            used = self.learned.get(view_func)
+            if used:
+                send_early_hints(request, used)
+        return None
+
+
+def preload_bundles(*bundles, kind=None, early_hints=None):
+    """
+    View decorator, the response gets Link preload headers for the bundles
+    the view renders and for ``bundles``, declared bundles are hinted with
+    a 103 before the view runs when ``early_hints`` (by default the
+    EARLY_HINTS option)
+    Template responses are rendered by the decorator to see their bundles
+    """
+    declared = [(name, normalize_kind(kind)) for name in bundles]
+
+    def before(request):
+        hint = early_hints
+        if hint is None:
+            hint = get_option('EARLY_HINTS')
+        if hint and declared:
+            send_early_hints(request, declared)
+        used = list(declared)
+        return used, rendered_bundles.set(used)
+
+    def render(response):
+        if not getattr(response, "is_rendered", True):
+            response.render()
+        return response
+
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def wrapper(request, *args, **kw):
+                used, token = before(request)
+                try:
+                    response = render(await view(request, *args, **kw))
+                finally:
+                    rendered_bundles.reset(token)
+                return add_link_header(response, used)
+        else:
+            @functools.wraps(view)
+            def wrapper(request, *args, **kw):
+                used, token = before(request)
+                try:
+                    response = render(view(request, *args, **kw))
+                finally:
+                    rendered_bundles.reset(token)
+                return add_link_header(response, used)
+        return wrapper
+    return decorator
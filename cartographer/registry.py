@@ -4,21 +4,81 @@ Asset manifest registry
 """
 
 import json
+import os
 import collections
+import collections.abc
+import sys
+import threading
+import time
+import types
+import urllib.parse
 
-from django.template.loader import get_template as loader_get_template
+from asgiref.sync import sync_to_async
 
+from .conf import get_option
 from .defaults import UPDATABLE_BUNDLES
+from .renderers import get_template, get_emitter, render_link
+from .signals import (observed, bundles_changed, manifest_changed,
+                      source_state_changed)
 from .errors import (NotRegisteredBundle, NotRegisteredAsset,
-                     AlreadyRegisteredBundle, AlreadyRegisteredAsset)
+                     AlreadyRegisteredBundle, AlreadyRegisteredAsset,
+                     AssetMapError)
 
+SERIALIZATION_VERSION = 2
+# Version 1 assets have no integrity nor content, still loadable
+SUPPORTED_VERSIONS = (1, 2)
 
-class Bundle(collections.UserDict):
+
+def get_kind(name):
+    """
+    Kind of an asset, its extension without the dot
+    "main.3f2a.js" -> "js", "/static/style.css?v=1" -> "css"
+    """
+    path = urllib.parse.urlsplit(name).path
+    return os.path.splitext(os.path.basename(path))[1][1:].lower()
+
+
+class Asset(collections.namedtuple(
+        "Asset", ["name", "url", "kind", "integrity", "content"],
+        defaults=(None, None))):
+    """
+    Compact immutable asset record, strings are interned since the same
+    names, urls and kinds repeat across bundles, reloads and processes
+    ``integrity`` and ``content`` (small assets to inline) are only set
+    when enabled, see cartographer.integrity
+    """
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, name, url, kind=None, integrity=None, content=None):
+        if kind is None:
+            kind = get_kind(name)
+        return cls(sys.intern(name), url and sys.intern(url),
+                   sys.intern(kind), integrity, content)
+
+    def serialize(self):
+        """
+        ``[name, url, kind]`` list, followed by integrity and content
+        when set
+        """
+        fields = list(self)
+        while len(fields) > 3 and fields[-1] is None:
+            fields.pop()
+        return fields
+
+
+class Bundle(collections.abc.Mapping):
     """
     Holds logic of the bundle
-    Overrides collections.UserDict to behave like a common dict
+    Behaves like a read only dict of Asset records, assets are given on
+    initialization and a built bundle never changes, reloads build a new one
+    when its assets or settings changed
     """
-    def __init__(self, **kw):
+    __slots__ = ("name", "ORIGIN", "SOURCE", "BUNDLES_DIRNAME",
+                 "TAG_TEMPLATES", "IGNORE", "updatable", "templates",
+                 "emitters", "assets", "data", "index", "links")
+
+    def __init__(self, assets=(), **kw):
         """
         Bundle initializes with "settings", keywords passed on initialization
         will be used as object attributes, not data
@@ -27,15 +87,104 @@ class Bundle(collections.UserDict):
             self.__setattr__(k, v)
         self.updatable = self.ORIGIN in UPDATABLE_BUNDLES
         self.get_templates()
-        super(Bundle, self).__init__()
+        data = {}
+        for asset in assets:
+            # Non standard behaviour, asset is being override
+            if not self.updatable and asset.name in data:
+                raise AlreadyRegisteredAsset(asset.name)
+            data[asset.name] = asset
+        self.data = data
+        # First seen order, the last record of an overridden asset wins
+        self.assets = tuple(data.values())
+        self.index = self.build_index()
+        self.links = None
+
+    def build_index(self):
+        """
+        Ordered assets by kind, built once per bundle
+        """
+        index = {}
+        for asset in self.assets:
+            index.setdefault(asset.kind, []).append(asset)
+        return {kind: tuple(assets) for kind, assets in index.items()}
+
+    def build_links(self):
+        """
+        Link preload header values by kind, "" for every asset
+        """
+        modules = get_option('PRELOAD_MODULES')
+        links = {"": []}
+        for asset in self.assets:
+            link = render_link(asset, modules)
+            if link is not None:
+                links[""].append(link)
+                links.setdefault(asset.kind, []).append(link)
+        return {kind: tuple(values) for kind, values in links.items()}
+
+    def get_links(self, kind=("",)):
+        """
+        Link header values of the assets of ``kind``, a normalized tuple
+        Built on first use, once per bundle, bundles which are never
+        preloaded do not hold them
+        """
+        links = self.links
+        if links is None:
+            links = self.links = self.build_links()
+        if len(kind) == 1:
+            return links.get(kind[0], ())
+        return tuple(link for ext in kind for link in links.get(ext, ()))
 
     def get_templates(self):
         """
-        Initialize templates
+        Initialize templates, shared by every bundle of the process
         """
         # TODO: Raise raise improperly configured
-        self.templates = {tag: loader_get_template(path)
+        self.templates = {tag: get_template(path)
                           for tag, path in self.TAG_TEMPLATES.items()}
+        self.emitters = {tag: get_emitter(path)
+                         for tag, path in self.TAG_TEMPLATES.items()}
+
+    def get_emitter(self, asset):
+        """
+        Compiled tag template for the asset kind
+        """
+        return self.emitters[self.data[asset].kind]
+
+    # Settings kept when the bundle is serialized, those two equal bundles
+    # share, IGNORE is already reflected by the assets
+    serialized_settings = ("ORIGIN", "SOURCE", "BUNDLES_DIRNAME",
+                           "TAG_TEMPLATES")
+
+    def matches(self, assets, **settings):
+        """
+        True when the bundle holds the same ``assets`` records, in the same
+        order, and serialized ``settings``, building it again would change
+        nothing, bundles loaded from a cache or a snapshot compare equal to
+        parsed ones
+        """
+        return self.assets == tuple(assets) and all(
+            getattr(self, key, None) == settings.get(key)
+            for key in self.serialized_settings)
+
+    def same_as(self, other):
+        return self is other or self.matches(other.assets, **{
+            key: getattr(other, key, None)
+            for key in self.serialized_settings})
+
+    def serialize(self):
+        """
+        Compact representation, assets are ``[name, url, kind]`` lists
+        """
+        data = {k: getattr(self, k, None) for k in self.serialized_settings}
+        data["name"] = self.name
+        data["assets"] = [asset.serialize() for asset in self.assets]
+        return data
+
+    @classmethod
+    def deserialize(cls, data):
+        data = dict(data)
+        assets = [Asset.create(*asset) for asset in data.pop("assets")]
+        return cls(assets, **data)
 
     def to_registry(self):
         # TODO: check is used ? is needed ?
@@ -43,53 +192,310 @@ class Bundle(collections.UserDict):
 
     def filter_assets(self, kind=None):
         """
-        Filter contents of the bundle by extension
+        Filter contents of the bundle by extension, an empty kind matches
+        every asset
         """
-        # TODO: Use a proper/better check of the extension
         kind = kind or [""]
-        extension = lambda name, ext: name.endswith(ext)
         for ext in kind:
-            for name in self:
-                if extension(name, ext):
-                    yield (name, self[name])
+            assets = self.index.get(ext.lstrip(".").lower(), ()) if ext \
+                else self.assets
+            for asset in assets:
+                yield (asset.name, asset)
 
     def __getitem__(self, asset):
         try:
-            return super(Bundle, self).__getitem__(asset)
+            return self.data[asset]
         except KeyError:
             raise NotRegisteredAsset(asset)
 
-    def __setitem__(self, asset, value):
-        # Non standard behaviour, asset is being override
+    def __iter__(self):
+        return (asset.name for asset in self.assets)
 
-        if not self.updatable and asset in self:
-            raise AlreadyRegisteredAsset(asset)
-        super(Bundle, self).__setitem__(asset, value)
+    def __len__(self):
+        return len(self.assets)
 
-    def __delitem__(self, asset):
-        if asset not in self:
-            raise NotRegisteredAsset(asset)
-        super(Bundle, self).__delitem__(asset)
+    def __repr__(self):
+        return "<Bundle {}: {}>".format(self.name, list(self))
 
 
-class AssetManifestRegistry(collections.UserDict):
+class Snapshot(collections.namedtuple("Snapshot", ["generation", "bundles"])):
+    """
+    Immutable state of the registry, bundles and the generation they belong
+    to travel together so readers never mix two reloads
+    """
+    __slots__ = ()
+
+    def get_bundle(self, bundle):
+        try:
+            return self.bundles[bundle]
+        except KeyError:
+            raise NotRegisteredBundle(bundle)
+
+
+class AssetsDiff(collections.namedtuple(
+        "AssetsDiff", ["added", "removed", "changed"])):
+    """
+    Asset names added to, removed from and changed (url, integrity or
+    content) in a bundle, all empty when only their order changed
+    """
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, old, new):
+        old = old.data if old is not None else {}
+        new = new.data if new is not None else {}
+        return cls(tuple(name for name in new if name not in old),
+                   tuple(name for name in old if name not in new),
+                   tuple(name for name, asset in new.items()
+                         if name in old and old[name] != asset))
+
+
+class ManifestDiff(collections.namedtuple(
+        "ManifestDiff", ["added", "removed", "changed", "assets"])):
+    """
+    Structural difference of two snapshots, ``added``, ``removed`` and
+    ``changed`` bundle names and ``assets`` mapping each of them to its
+    AssetsDiff
+    """
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, old, new):
+        """
+        Diff of the ``old`` and ``new`` bundles mappings
+        """
+        added = tuple(name for name in new if name not in old)
+        removed = tuple(name for name in old if name not in new)
+        changed = tuple(name for name, bundle in new.items()
+                        if name in old and old[name] is not bundle)
+        assets = {name: AssetsDiff.create(old.get(name), new.get(name))
+                  for name in added + removed + changed}
+        return cls(added, removed, changed, assets)
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+
+class SourceState(collections.namedtuple(
+        "SourceState", ["status", "since", "message"])):
+    """
+    Last load of a source: "done", "compiling" (webpack is building),
+    "unreadable" (being written or invalid) or "error" (webpack failed),
+    ``since`` is the time.time() it entered this status
+    While a source is not done its last good bundles keep being served
+    """
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, status, message=None):
+        return cls(status, time.time(), message)
+
+    @property
+    def settled(self):
+        """
+        Webpack is done with the source, waiting can not change it
+        """
+        return self.status in ("done", "error")
+
+
+class AssetManifestRegistry(collections.abc.Mapping):
     """
     Manifest registry interface to store manifest entries
+
+    Readers never lock, every change builds a new snapshot off to the side
+    and publishes it with a single reference swap
     """
     def __init__(self, *args, **kw):
         """
         Hold a registry of incoming
         """
-        super(AssetManifestRegistry, self).__init__(*args, **kw)
+        # Serializes writers only
+        self._lock = threading.Lock()
+        # Notified when sources state change
+        self._settled = threading.Condition(self._lock)
+        self.snapshot = Snapshot(0, types.MappingProxyType({}))
+        # Callable populating missing bundles on demand, see LazyLoader
+        self.loader = None
+        # Source -> SourceState, replaced on change like the snapshot
+        self.states = types.MappingProxyType({})
+        # Sources still being written by webpack
+        self.unsettled = frozenset()
+        # Seconds readers may wait for unsettled sources, None never waits
+        self.wait_timeout = None
+        bundles = dict(*args, **kw)
+        if bundles:
+            self.publish(bundles)
+
+    @property
+    def generation(self):
+        """
+        Bumped on every change, lets consumers cache derived data
+        """
+        return self.snapshot.generation
 
     def get_registry(self):
         return self
 
+    def ensure_loaded(self, bundle=None):
+        """
+        Give the loader a chance to populate ``bundle``, every bundle when
+        not given
+        """
+        loader = self.loader
+        if loader is not None and (
+                bundle is None or bundle not in self.snapshot.bundles):
+            loader(bundle)
+        if self.unsettled and self.wait_timeout:
+            self.wait_settled(bundle)
+
+    def get_state(self, source):
+        """
+        SourceState of ``source``, None when it was never loaded
+        """
+        return self.states.get(source)
+
+    def wait_settled(self, bundle=None, timeout=None):
+        """
+        Block until the source of ``bundle`` (every source when not given
+        or unknown yet) is settled, for at most ``timeout`` seconds since
+        it became unsettled, False if still unsettled
+        Readers only wait, reloading is left to the watcher and retries
+        """
+        if timeout is None:
+            timeout = self.wait_timeout or 0
+        with self._settled:
+            while True:
+                sources = self.unsettled
+                if bundle is not None and bundle in self.snapshot.bundles:
+                    sources = sources & {
+                        self.snapshot.bundles[bundle].SOURCE}
+                if not sources:
+                    return True
+                remaining = max(self.states[source].since
+                                for source in sources) + timeout - time.time()
+                if remaining <= 0:
+                    return False
+                self._settled.wait(remaining)
+
+    def get_snapshot(self, bundle=None):
+        """
+        Current snapshot, loading ``bundle`` first if needed
+        """
+        self.ensure_loaded(bundle)
+        return self.snapshot
+
+    async def aensure_loaded(self, bundle=None):
+        """
+        Awaitable ``ensure_loaded``, the loader reads and parses files and
+        waiting blocks so they run in a worker thread, loaded bundles
+        return right away
+        """
+        loaded = self.loader is None or (
+            bundle is not None and bundle in self.snapshot.bundles)
+        if loaded and not (self.unsettled and self.wait_timeout):
+            return
+        await sync_to_async(self.ensure_loaded,
+                            thread_sensitive=False)(bundle)
+
+    async def aget_snapshot(self, bundle=None):
+        await self.aensure_loaded(bundle)
+        return self.snapshot
+
+    async def aget_bundle(self, bundle):
+        """
+        Awaitable bundle lookup
+        """
+        snapshot = await self.aget_snapshot(bundle)
+        return snapshot.get_bundle(bundle)
+
+    def publish(self, bundles, removed=(), replace=False, states=None):
+        """
+        Publish a new snapshot adding/replacing ``bundles`` and dropping
+        ``removed`` bundle names, with ``replace`` ``bundles`` becomes the
+        whole content of the registry
+        Published bundles equal to the current ones are not replaced, they
+        keep their identity and everything cached from them, when nothing
+        changed no snapshot is published
+        ``states`` maps sources to their SourceState, they change along
+        with the snapshot, readers waiting for them see the new bundles
+        """
+        with self._lock:
+            changed = self._set_states(states) if states else {}
+            current = self.snapshot.bundles
+            data = collections.OrderedDict(() if replace else current)
+            for bundle in removed:
+                if bundle not in data:
+                    raise NotRegisteredBundle(bundle)
+                del data[bundle]
+            for bundle, value in bundles.items():
+                previous = current.get(bundle)
+                if previous is not None and previous.same_as(value):
+                    # Loaded again (lazy loader, new leader), not replaced
+                    value = previous
+                elif bundle in data and not data[bundle].updatable:
+                    # Non standard behaviour, asset is being overriden
+                    raise AlreadyRegisteredBundle(bundle)
+                data[bundle] = value
+            diff = ManifestDiff.create(current, data)
+            if diff:
+                self.snapshot = Snapshot(self.snapshot.generation + 1,
+                                         types.MappingProxyType(data))
+            snapshot = self.snapshot
+            if changed:
+                self._settled.notify_all()
+        self._send_states(changed)
+        if not diff:
+            return snapshot
+        if observed(manifest_changed):
+            manifest_changed.send(sender=self.__class__, added=diff.added,
+                                  removed=diff.removed, changed=diff.changed,
+                                  assets=diff.assets,
+                                  generation=snapshot.generation)
+        if observed(bundles_changed):
+            bundles_changed.send(sender=self.__class__,
+                                 bundles=list(diff.added + diff.changed),
+                                 removed=list(diff.removed),
+                                 generation=snapshot.generation)
+        return snapshot
+
+    def set_states(self, states):
+        """
+        Change sources state without publishing bundles
+        """
+        with self._lock:
+            changed = self._set_states(states)
+            self._settled.notify_all()
+        self._send_states(changed)
+
+    def _set_states(self, states):
+        """
+        Record the states which changed, the lock must be held
+        """
+        changed = {}
+        for source, state in states.items():
+            previous = self.states.get(source)
+            if previous is None or (previous.status, previous.message) != (
+                    state.status, state.message):
+                changed[source] = state
+        if changed:
+            current = dict(self.states, **changed)
+            self.states = types.MappingProxyType(current)
+            self.unsettled = frozenset(
+                source for source, state in current.items()
+                if not state.settled)
+        return changed
+
+    def _send_states(self, changed):
+        if changed and observed(source_state_changed):
+            for source, state in changed.items():
+                source_state_changed.send(sender=self.__class__,
+                                          source=source, state=state)
+
     def filter_updatable(self):
         """
         Updatable bundles are those whose assets can change
         """
-        for bundle_name, bundle in self.items():
+        for bundle_name, bundle in self.get_snapshot().bundles.items():
             if bundle.ORIGIN in UPDATABLE_BUNDLES:
                 yield (bundle_name, bundle)
 
@@ -99,25 +505,44 @@ class AssetManifestRegistry(collections.UserDict):
 
     def __getitem__(self, bundle):
         """ Returns bundle """
-        try:
-            return super(AssetManifestRegistry, self).__getitem__(bundle)
-        except KeyError:
-            raise NotRegisteredBundle(bundle)
+        return self.get_snapshot(bundle).get_bundle(bundle)
+
+    def __iter__(self):
+        return iter(self.get_snapshot().bundles)
+
+    def __len__(self):
+        return len(self.get_snapshot().bundles)
 
     def __setitem__(self, bundle, value):
-        # Non standard behaviour, asset is being overriden
-        if bundle in self and not self[bundle].updatable:
-            raise AlreadyRegisteredBundle(bundle)
-        super(AssetManifestRegistry, self).__setitem__(bundle, value)
+        self.publish({bundle: value})
 
     def __delitem__(self, bundle):
         """ Delete bundle """
-        if bundle not in self:
-            raise NotRegisteredBundle(bundle)
-        super(AssetManifestRegistry, self).__delitem__(bundle)
+        self.publish({}, removed=[bundle])
 
     def serialize_json(self):
-        json.dumps(self)
+        """
+        Dump the current snapshot, see ``load_json``
+        """
+        bundles = self.get_snapshot().bundles
+        return json.dumps({
+            "version": SERIALIZATION_VERSION,
+            "bundles": [bundle.serialize() for bundle in bundles.values()],
+        }, separators=(",", ":"))
+
+    def load_json(self, data, replace=False):
+        """
+        Publish the bundles of a ``serialize_json`` dump
+        """
+        data = json.loads(data)
+        if data.get("version") not in SUPPORTED_VERSIONS:
+            raise AssetMapError(
+                "Unsupported manifest version {}".format(data.get("version")))
+        bundles = collections.OrderedDict()
+        for bundle_data in data["bundles"]:
+            bundle = Bundle.deserialize(bundle_data)
+            bundles[bundle.name] = bundle
+        return self.publish(bundles, replace=replace)
 
 manifest = AssetManifestRegistry()
 
@@ -0,0 +1,228 @@
+#! -*- coding: utf-8 -*-
+"""
+Tag renderers
+
+TAG_TEMPLATES are compiled once per process into emitters, plain string
+formatting with the same output as the django template, custom templates
+using anything else than ``{{ VAR }}`` / ``{{ VAR|safe }}`` and
+``{% if VAR %}`` blocks are rendered by django as usual
+
+Templates get ASSET_URL, ASSET_INTEGRITY (subresource integrity, None
+unless INTEGRITY is set) and ASSET_CONTENT (None unless the asset is small
+enough to be inlined)
+"""
+
+import re
+
+from django.template.loader import get_template as loader_get_template
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+try:
+    from django.template.base import Lexer, TokenType
+except ImportError:
+    Lexer = TokenType = None
+
+from .errors import CartographerWebpackStatsError
+
+VARIABLE_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+# Preload destination of the asset kinds, other kinds are not preloaded
+PRELOAD_AS = {
+    "js": "script", "mjs": "script", "css": "style",
+    "woff": "font", "woff2": "font", "ttf": "font", "otf": "font",
+    "png": "image", "jpg": "image", "jpeg": "image", "gif": "image",
+    "svg": "image", "webp": "image", "avif": "image",
+}
+
+# Process wide caches, keyed by template path
+_templates = {}
+_emitters = {}
+
+
+def get_template(path):
+    """
+    Loaded template, the loader runs once per path and process
+    """
+    template = _templates.get(path)
+    if template is None:
+        template = _templates[path] = loader_get_template(path)
+    return template
+
+
+def get_emitter(path):
+    """
+    Compiled emitter for the template, compiled once per path and process
+    """
+    emitter = _emitters.get(path)
+    if emitter is None:
+        emitter = _emitters[path] = compile_template(get_template(path))
+    return emitter
+
+
+def clear():
+    _templates.clear()
+    _emitters.clear()
+
+
+class TemplateEmitter(object):
+    """
+    Fallback emitter, renders through django
+    """
+    def __init__(self, template):
+        self.template = template
+
+    def __call__(self, context):
+        return self.template.render(context)
+
+
+class FormatEmitter(object):
+    """
+    Emitter compiled to a format string
+    """
+    def __init__(self, template, escaped):
+        self.template = template
+        # Variable name -> escape it ?
+        self.escaped = escaped
+
+    def get_values(self, context, names=None):
+        values = {}
+        for name in self.escaped if names is None else names:
+            value = context.get(name, "")
+            values[name] = conditional_escape(value) \
+                if self.escaped[name] else value
+        return values
+
+    def __call__(self, context):
+        return self.template.format(**self.get_values(context))
+
+
+class ConditionalEmitter(FormatEmitter):
+    """
+    Emitter compiled to format strings, each one rendered when its
+    ``{% if VAR %}`` conditions hold
+    The output only depends on the truth of the tested variables, their
+    segments are joined once per combination into a single format string
+    """
+    def __init__(self, segments, escaped):
+        # ((variable, truth), ...), format string
+        self.segments = segments
+        self.escaped = escaped
+        self.tested = tuple(sorted({name for conditions, _ in segments
+                                    for name, _ in conditions}))
+        self.templates = {}
+
+    def get_template(self, truths):
+        """
+        Format string and the variables it uses for these truths
+        """
+        compiled = self.templates.get(truths)
+        if compiled is None:
+            values = dict(zip(self.tested, truths))
+            template = "".join(
+                part for conditions, part in self.segments
+                if all(values[name] is truth for name, truth in conditions))
+            names = tuple(name for name in self.escaped
+                          if "{%s}" % name in template)
+            compiled = self.templates[truths] = (template, names)
+        return compiled
+
+    def __call__(self, context):
+        template, names = self.get_template(
+            tuple(bool(context.get(name)) for name in self.tested))
+        return template.format(**self.get_values(context, names))
+
+
+def compile_template(template):
+    """
+    Return the fastest emitter able to render ``template``
+    Supported: text, ``{{ VAR }}``, ``{{ VAR|safe }}`` and ``{% if VAR %}``
+    blocks (with ``{% else %}``, nested)
+    """
+    source = getattr(getattr(template, "template", None), "source", None)
+    if Lexer is None or source is None:
+        return TemplateEmitter(template)
+    segments, parts, escaped = [], [], {}
+    # Conditions of the current block, innermost last
+    conditions = []
+
+    def flush():
+        if parts:
+            segments.append((tuple(conditions), "".join(parts)))
+            del parts[:]
+
+    for token in Lexer(source).tokenize():
+        if token.token_type == TokenType.TEXT:
+            parts.append(token.contents.replace("{", "{{").replace("}", "}}"))
+        elif token.token_type == TokenType.VAR:
+            name, _, filters = token.contents.partition("|")
+            name, filters = name.strip(), filters.strip()
+            if not VARIABLE_RE.match(name) or filters not in ("", "safe"):
+                return TemplateEmitter(template)
+            escaped[name] = escaped.get(name, True) and not filters
+            parts.append("{%s}" % name)
+        elif token.token_type == TokenType.COMMENT:
+            continue
+        elif token.token_type == TokenType.BLOCK:
+            bits = token.split_contents()
+            if len(bits) == 2 and bits[0] == "if" and \
+                    VARIABLE_RE.match(bits[1]):
+                flush()
+                conditions.append((bits[1], True))
+            elif bits == ["else"] and conditions:
+                flush()
+                conditions[-1] = (conditions[-1][0], False)
+            elif bits == ["endif"] and conditions:
+                flush()
+                conditions.pop()
+            else:
+                return TemplateEmitter(template)
+        else:
+            return TemplateEmitter(template)
+    if conditions:
+        return TemplateEmitter(template)
+    flush()
+    if all(not segment_conditions for segment_conditions, _ in segments):
+        return FormatEmitter("".join(part for _, part in segments), escaped)
+    return ConditionalEmitter(tuple(segments), escaped)
+
+
+def render_items(items):
+    """
+    Render ``(bundle, name, asset)`` items, each with its bundle templates
+    """
+    tags = []
+    for bundle, name, asset in items:
+        try:
+            emitter = bundle.get_emitter(name)
+        except KeyError as e:
+            raise CartographerWebpackStatsError(e)
+        tags.append(emitter({"ASSET_URL": asset.url,
+                             "ASSET_INTEGRITY": asset.integrity,
+                             "ASSET_CONTENT": asset.content}))
+    return mark_safe("\n".join(tags))
+
+
+def render_link(asset, modules=False):
+    """
+    Link header value preloading ``asset``, None for kinds not preloaded,
+    with ``modules`` scripts are preloaded as modules
+    Assets with an integrity hash are preloaded in the cors mode of their
+    tags (crossorigin="anonymous"), a preload in another mode is not
+    reused and the file would be downloaded twice
+    """
+    destination = PRELOAD_AS.get(asset.kind)
+    if destination is None or asset.content is not None:
+        # Inlined assets are not fetched
+        return None
+    if destination == "script" and (modules or asset.kind == "mjs"):
+        link = "<{}>; rel=modulepreload".format(asset.url)
+    else:
+        link = "<{}>; rel=preload; as={}".format(asset.url, destination)
+    if asset.integrity is not None:
+        return '{}; crossorigin; integrity="{}"'.format(link,
+                                                       asset.integrity)
+    if destination == "font":
+        # Fonts are always fetched in cors mode
+        return "{}; crossorigin".format(link)
+    return link
@@ -0,0 +1,90 @@
+#! -*- coding: utf-8 -*-
+"""
+Static urls resolution
+
+``staticfiles_storage.url`` can hash files or look them up in a manifest,
+resolved urls are memoized per storage manifest version and every asset
+of a reload is resolved in one batch, urls of files no source lists
+anymore are pruned after each reload
+"""
+
+import os
+import threading
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+
+
+class StaticURLResolver(object):
+    def __init__(self, storage=None):
+        self.storage = storage if storage is not None else staticfiles_storage
+        self.lock = threading.Lock()
+        self.urls = {}
+        self.version = None
+
+    def get_version(self):
+        """
+        Version of the storage manifest (staticfiles.json), urls resolved
+        for a previous version are stale, None for storages without one
+        """
+        manifest_name = getattr(self.storage, "manifest_name", None)
+        if manifest_name is None:
+            return None
+        manifest_storage = getattr(self.storage, "manifest_storage",
+                                   self.storage)
+        try:
+            stat = os.stat(manifest_storage.path(manifest_name))
+        except (NotImplementedError, OSError):
+            # Remote storages, the manifest is read once per process
+            return manifest_name
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload_manifest(self):
+        """
+        Read the storage manifest once for the whole batch
+        """
+        load_manifest = getattr(self.storage, "load_manifest", None)
+        if load_manifest is None:
+            return
+        manifest = load_manifest()
+        if isinstance(manifest, tuple):
+            self.storage.hashed_files, self.storage.manifest_hash = manifest
+        else:
+            self.storage.hashed_files = manifest
+
+    def resolve_many(self, paths):
+        """
+        Urls of ``paths``, only paths unknown for the current manifest
+        version hit the storage
+        """
+        with self.lock:
+            version = self.get_version()
+            if version != self.version:
+                if self.version is not None:
+                    self.reload_manifest()
+                self.urls, self.version = {}, version
+            urls = self.urls
+            for path in paths:
+                if path not in urls:
+                    urls[path] = self.storage.url(path)
+            return [urls[path] for path in paths]
+
+    def resolve(self, path):
+        return self.resolve_many([path])[0]
+
+    def prune(self, paths):
+        """
+        Keep only the urls of ``paths``
+        """
+        with self.lock:
+            self.urls = {path: url for path, url in self.urls.items()
+                         if path in paths}
+
+    def clear(self):
+        with self.lock:
+            self.urls, self.version = {}, None
+
+resolver = StaticURLResolver()
+
+
+def get_resolver():
+    return resolver
@@ -0,0 +1,201 @@
+#! -*- coding: utf-8 -*-
+"""
+Registry shared by every process of a host
+
+A leader, elected through a lock file, parses and watches the sources and
+publishes the serialized registry in a snapshot file. Followers read the
+snapshot instead of parsing the sources, and load it again only when its
+generation changes.
+
+Snapshot layout: MAGIC, generation and payload length as a fixed header
+followed by the ``serialize_json`` payload
+"""
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .errors import CartographerConfigError
+from .files import write_aside
+from .parsers import autodiscover, get_sources
+from .signals import manifest_changed
+from .utils import updatable_sources_watcher
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CARTSNAP"
+HEADER = struct.Struct("<8sQQ")
+
+
+def get_snapshot_path(options):
+    """
+    Configured snapshot path, by default one per set of sources
+    """
+    if options['SHARED_SNAPSHOT']:
+        return options['SHARED_SNAPSHOT']
+    key = hashlib.sha1(json.dumps(
+        sorted(os.path.abspath(s) for s in get_sources())).encode("utf-8"))
+    return os.path.join(tempfile.gettempdir(),
+                        "cartographer-{}.snapshot".format(key.hexdigest()))
+
+
+def read_header(path):
+    """
+    Return ``(generation, length)`` of a snapshot, ``(0, 0)`` if missing
+    """
+    try:
+        with open(path, 'rb') as snapshot:
+            magic, generation, length = HEADER.unpack(
+                snapshot.read(HEADER.size))
+    except (OSError, struct.error):
+        return 0, 0
+    if magic != MAGIC:
+        return 0, 0
+    return generation, length
+
+
+def write_snapshot(path, payload):
+    """
+    Write ``payload`` with the next generation, see write_aside
+    """
+    generation = read_header(path)[0] + 1
+    write_aside(path, [HEADER.pack(MAGIC, generation, len(payload)),
+                       payload])
+    return generation
+
+
+class SnapshotReader(object):
+    """
+    Loads the snapshot file in the registry on generation changes
+    """
+    def __init__(self, path, registry):
+        self.path = path
+        self.registry = registry
+        self.signature = None
+        self.generation = None
+
+    def check(self):
+        """
+        Load the snapshot if it changed, cheap when it did not (a stat)
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self.signature or stat.st_size < HEADER.size:
+            return False
+        with open(self.path, 'rb') as snapshot:
+            magic, generation, length = HEADER.unpack(
+                snapshot.read(HEADER.size))
+            self.signature = signature
+            if magic != MAGIC or generation == self.generation:
+                return False
+            payload = snapshot.read(length)
+        self.registry.load_json(payload.decode("utf-8"), replace=True)
+        self.generation = generation
+        return True
+
+
+class SharedRegistry(object):
+    """
+    Coordinates the processes of a host around one snapshot file
+    """
+    def __init__(self, registry, options):
+        if fcntl is None:
+            raise CartographerConfigError(
+                "SHARED mode requires a platform supporting fcntl")
+        self.registry = registry
+        self.options = options
+        self.path = get_snapshot_path(options)
+        self.reader = SnapshotReader(self.path, registry)
+        self.lock_file = None
+        self.stopped = threading.Event()
+        # Serializes shares, generation of the last shared registry
+        self.share_lock = threading.Lock()
+        self.shared_generation = None
+
+    @property
+    def leader(self):
+        return self.lock_file is not None
+
+    def try_lead(self):
+        """
+        Take the lock, kept for the process life time
+        """
+        lock_file = open("{}.lock".format(self.path), 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self.lock_file = lock_file
+        return True
+
+    def share(self):
+        """
+        Publish the registry to the followers, unless already shared
+        """
+        with self.share_lock:
+            generation = self.registry.generation
+            if generation == self.shared_generation:
+                return
+            payload = self.registry.serialize_json().encode("utf-8")
+            shared = write_snapshot(self.path, payload)
+            self.shared_generation = generation
+        logger.debug("Shared registry generation %s", shared)
+
+    def on_manifest_changed(self, **kw):
+        """
+        Share every publish of the leader, from the watcher, the retries
+        of unsettled sources or the lazy loader alike
+        """
+        try:
+            self.share()
+        except Exception:
+            logger.exception("Error sharing registry %s", self.path)
+
+    def lead(self):
+        logger.debug("Leading shared registry %s", self.path)
+        manifest_changed.connect(self.on_manifest_changed, weak=False)
+        autodiscover()
+        self.share()
+        updatable_sources_watcher()
+
+    def follow(self):
+        """
+        Poll the snapshot, take over if the leader goes away
+        """
+        while not self.stopped.wait(self.options['POLL_INTERVAL']):
+            if self.try_lead():
+                self.lead()
+                return
+            try:
+                self.reader.check()
+            except Exception:
+                logger.exception("Error loading snapshot %s", self.path)
+
+    def start(self):
+        if self.try_lead():
+            self.lead()
+            return
+        if not self.reader.check():
+            # Leader did not share yet, do not serve an empty registry
+            autodiscover()
+        thread = threading.Thread(target=self.follow,
+                                  name="cartographer-shared")
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        manifest_changed.disconnect(self.on_manifest_changed)
@@ -1 +1,43 @@
-# will hook into collectstatic
+# -*- coding: utf-8 -*-
+"""
+Cartographer signals
+
+Arguments are only computed when a signal has receivers, unobserved
+signals cost an attribute lookup
+"""
+
+from django.dispatch import Signal
+
+# A source is parsed (memoized documents are not), ``source``
+parse_started = Signal()
+# ``source``, ``duration`` in seconds, ``bytes_read``
+parse_finished = Signal()
+
+# Watcher events coalesced into one reload, ``sources``, ``events``
+reload_triggered = Signal()
+
+# A new registry snapshot is published, ``bundles`` added or replaced
+# names, ``removed`` names, ``generation``
+bundles_changed = Signal()
+
+# The published bundles differ from the previous snapshot, ``added``,
+# ``removed`` and ``changed`` bundle names, ``assets`` maps each of them to
+# the AssetsDiff of its asset names, ``generation``
+manifest_changed = Signal()
+
+# A source changed its SourceState, ``source``, ``state``
+source_state_changed = Signal()
+
+# ``bundle`` name, ``kind`` tuple, ``duration`` in seconds, ``cached``
+bundle_rendered = Signal()
+
+# ``cache`` name ("fragments", "manifest", "stats"), ``key``
+cache_hit = Signal()
+cache_miss = Signal()
+
+
+def observed(signal):
+    """
+    Cheap check, use it before computing signal arguments
+    """
+    return bool(signal.receivers)
@@ -0,0 +1,204 @@
+#! -*- coding: utf-8 -*-
+"""
+Streaming extraction from json stats files
+
+Verbose webpack stats contain every module and chunk, only a few top level
+keys and some entries of "chunks" are needed. The file is read by blocks
+and everything else is skipped without building python objects, peak
+memory is bounded by the block size and the extracted values
+"""
+
+import json
+import re
+
+BLOCKSIZE = 1 << 16
+
+WHITESPACE_RE = re.compile(r'[ \t\n\r]*')
+# Body of a string, stops before the closing quote or a trailing backslash
+STRING_BODY_RE = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+# Anything but brackets, complete strings included
+FLAT_RE = re.compile(r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.S)
+SCALAR_END_RE = re.compile(r'[,\]}\s]')
+
+# Top level keys read by the webpack stats parser
+STATS_KEYS = ("status", "error", "message", "file")
+
+
+class Scanner(object):
+    """
+    Buffered json scanner, consumed data is dropped unless marked
+    """
+    def __init__(self, fileobj, blocksize=BLOCKSIZE):
+        self.file = fileobj
+        self.blocksize = blocksize
+        self.buffer = ""
+        self.pos = 0
+        self.mark = None
+        self.eof = False
+        self.bytes_read = 0
+
+    def fill(self):
+        """
+        Read one more block, False at the end of the file
+        """
+        if self.eof:
+            return False
+        keep = self.pos if self.mark is None else self.mark
+        block = self.file.read(self.blocksize)
+        self.bytes_read += len(block)
+        self.buffer = self.buffer[keep:] + block
+        self.pos -= keep
+        if self.mark is not None:
+            self.mark -= keep
+        if not block:
+            self.eof = True
+        return bool(block)
+
+    def error(self, message):
+        return ValueError("{} at offset {}".format(message, self.pos))
+
+    def peek(self):
+        while self.pos >= len(self.buffer):
+            if not self.fill():
+                raise self.error("Unexpected end of file")
+        return self.buffer[self.pos]
+
+    def skip_whitespace(self):
+        while True:
+            self.pos = WHITESPACE_RE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or not self.fill():
+                return
+
+    def expect(self, char):
+        self.skip_whitespace()
+        if self.peek() != char:
+            raise self.error("Expected {!r}".format(char))
+        self.pos += 1
+
+    def skip_string(self):
+        self.expect('"')
+        while True:
+            self.pos = STRING_BODY_RE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) and self.buffer[self.pos] == '"':
+                self.pos += 1
+                return
+            if not self.fill():
+                raise self.error("Unterminated string")
+
+    def skip_scalar(self):
+        while True:
+            match = SCALAR_END_RE.search(self.buffer, self.pos)
+            if match is not None:
+                self.pos = match.start()
+                return
+            self.pos = len(self.buffer)
+            if not self.fill():
+                return
+
+    def skip_value(self):
+        """
+        Move past the next value without decoding it
+        """
+        self.skip_whitespace()
+        char = self.peek()
+        if char == '"':
+            return self.skip_string()
+        if char not in "[{":
+            return self.skip_scalar()
+        depth = 0
+        while True:
+            self.pos = FLAT_RE.match(self.buffer, self.pos).end()
+            if self.pos >= len(self.buffer):
+                if not self.fill():
+                    raise self.error("Unexpected end of file")
+                continue
+            char = self.buffer[self.pos]
+            if char == '"':
+                # String cut by the end of the buffer
+                self.skip_string()
+                continue
+            self.pos += 1
+            depth += 1 if char in "[{" else -1
+            if depth == 0:
+                return
+
+    def read_value(self):
+        """
+        Decode the next value
+        """
+        self.skip_whitespace()
+        self.mark = self.pos
+        try:
+            self.skip_value()
+            return json.loads(self.buffer[self.mark:self.pos])
+        finally:
+            self.mark = None
+
+    def iter_object(self):
+        """
+        Yield the keys of the object starting here, the caller must read
+        or skip every value
+        """
+        self.expect('{')
+        self.skip_whitespace()
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            self.skip_whitespace()
+            key = self.read_value()
+            self.expect(':')
+            yield key
+            self.skip_whitespace()
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise self.error("Expected ',' or '}'")
+
+
+def extract(fileobj, chunks, keys=STATS_KEYS):
+    """
+    Extract the top level ``keys`` and the ``chunks`` entries named in
+    ``chunks`` from a webpack stats file object
+    Raises ValueError on invalid or truncated json, like json.load
+    """
+    chunks = frozenset(chunks)
+    scanner = Scanner(fileobj)
+    document = {}
+    for key in scanner.iter_object():
+        if key in keys:
+            document[key] = scanner.read_value()
+        elif key == "chunks":
+            document[key] = {}
+            for name in scanner.iter_object():
+                if name in chunks:
+                    document[key][name] = scanner.read_value()
+                else:
+                    scanner.skip_value()
+        else:
+            scanner.skip_value()
+    scanner.skip_whitespace()
+    if scanner.pos < len(scanner.buffer):
+        raise scanner.error("Extra data")
+    return document
+
+
+def read_stats(path, chunks, stream=True, keys=STATS_KEYS):
+    """
+    Same result as ``extract`` for the stats file at ``path``, without
+    ``stream`` the whole file is decoded then trimmed
+    Small enough to be sent back from a worker process
+    """
+    with open(path, 'r', encoding="utf-8") as json_file:
+        if stream:
+            return extract(json_file, chunks, keys)
+        document = json.load(json_file)
+    chunks = frozenset(chunks)
+    trimmed = {key: document[key] for key in keys if key in document}
+    if "chunks" in document:
+        trimmed["chunks"] = {name: files
+                             for name, files in document["chunks"].items()
+                             if name in chunks}
+    return trimmed
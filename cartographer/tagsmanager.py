@@ -3,12 +3,133 @@
 Manifest parsers
 """
 
-from django.template import Context
+import contextlib
+import contextvars
+import time
 
-from .registry import get_registry
+from .chunks import get_graph
+from .registry import get_registry, get_kind
+from .renderers import render_items
+from .signals import (observed, bundle_rendered, cache_hit, cache_miss,
+                      manifest_changed)
 from .errors import CartographerWebpackStatsError
 
 
+def normalize_kind(kind=None):
+    """
+    Return the requested kinds as a hashable tuple, "js, css" -> ("js", "css")
+    Extensions are normalized like Bundle.filter_assets, ".JS" -> "js", so
+    renders, their cached fragments and preload links agree
+    """
+    if not kind:
+        return ("",)
+    if isinstance(kind, str):
+        kind = kind.split(",")
+    return tuple(ext.strip().lstrip(".").lower() for ext in kind)
+
+
+def normalize_names(names):
+    """
+    Return bundle names as a tuple, "a, b" -> ("a", "b")
+    """
+    if isinstance(names, str):
+        names = names.split(",")
+    return tuple(name.strip() for name in names if name.strip())
+
+
+# Bundles rendered in the current context, ``(name, kind)`` pairs appended
+# to the list set by the preload middleware, nothing is collected otherwise
+rendered_bundles = contextvars.ContextVar("rendered_bundles", default=None)
+
+
+# Names of the assets emitted in the current context, a set while tracking
+# (see track_assets), tracked renders skip the assets already emitted
+emitted_assets = contextvars.ContextVar("emitted_assets", default=None)
+
+
+@contextlib.contextmanager
+def track_assets():
+    """
+    Within the block every asset file is emitted once, whatever the
+    bundles and calls rendering it
+    """
+    token = emitted_assets.set(set())
+    try:
+        yield
+    finally:
+        emitted_assets.reset(token)
+
+
+class FragmentCache(object):
+    """
+    Rendered fragments, each valid for what it was rendered from: the
+    Bundle object of a single bundle, kept by reloads which do not change
+    it, or the whole snapshot for several bundles (see ChunkGraph)
+    """
+    def __init__(self):
+        self.fragments = {}
+
+    def get(self, key, source):
+        cached = self.fragments.get(key)
+        if cached is not None and cached[0] is source:
+            return cached[1]
+        return None
+
+    def set(self, key, source, fragment):
+        self.fragments[key] = (source, fragment)
+
+    def discard(self, bundles):
+        """
+        Drop the fragments of ``bundles`` names and those of several
+        bundles, stale ones would never be read again
+        """
+        bundles = frozenset(bundles)
+        # Renders may add fragments meanwhile, iterate an atomic copy
+        self.fragments = {
+            key: value for key, value in self.fragments.copy().items()
+            if not isinstance(key[0], tuple) and key[0] not in bundles}
+
+    def clear(self):
+        self.fragments = {}
+
+fragments = FragmentCache()
+# Assets to render, ``(bundle, name, asset)`` tuples, same keys
+items = FragmentCache()
+
+
+def discard_fragments(changed, removed, **kw):
+    """
+    manifest_changed receiver, only the changed bundles are rendered again
+    """
+    fragments.discard(changed + removed)
+    items.discard(changed + removed)
+
+manifest_changed.connect(discard_fragments)
+
+
+def get_source(snapshot, bundle_name):
+    """
+    What the fragments of ``bundle_name`` are rendered from, its Bundle or
+    the snapshot for a tuple of names
+    """
+    if isinstance(bundle_name, tuple):
+        return snapshot
+    return snapshot.get_bundle(bundle_name)
+
+
+class TrackAssetsMiddleware(object):
+    """
+    Track the assets emitted while a response is built, separate
+    render_bundle calls of a page never emit the same file twice
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with track_assets():
+            return self.get_response(request)
+
+
 class AssetTagsManagerBase(object):
     # TODO: Extend Node ??
     def __init__(self, manifest):
@@ -37,8 +158,7 @@ class AssetTagsManagerFromManifest(AssetTagsManagerBase):
         Return the proper template for the given asset
         """
         try:
-            # TODO: ugly uglu, use os
-            return bundle.templates[asset.split(".")[1]]
+            return bundle.templates[get_kind(asset)]
         except KeyError as e:
             raise CartographerWebpackStatsError(e)
 
@@ -46,15 +166,104 @@ class AssetTagsManagerFromManifest(AssetTagsManagerBase):
         """
         Find and return asset file url given package name
         """
-        asset = bundle[name]
-        return asset.get("url", None)
+        return bundle[name].url
 
     def render_bundle(self, bundle_name, kind=None):
-        tags = []
-        bundle = self.manifest[bundle_name]
-        for asset_name, asset in bundle.filter_assets(kind):
-            asset_url = self.get_file(bundle, asset_name)
-            template = self.get_template(bundle, asset_url)
-            tags.append(self.render_fragment(
-                template, context=Context({"ASSET_URL": asset_url})))
-        return "\n".join(tags)
+        started = time.perf_counter() if observed(bundle_rendered) else None
+        # Work on a single snapshot, a concurrent reload can not be mixed in
+        snapshot = self.manifest.get_snapshot(bundle_name)
+        return self.render_snapshot(snapshot, bundle_name, kind, started)
+
+    async def arender_bundle(self, bundle_name, kind=None):
+        """
+        Awaitable ``render_bundle``, only loading a missing bundle (or
+        waiting for webpack) leaves the event loop, rendering a loaded one
+        is cheap and cached
+        """
+        started = time.perf_counter() if observed(bundle_rendered) else None
+        snapshot = await self.manifest.aget_snapshot(bundle_name)
+        return self.render_snapshot(snapshot, bundle_name, kind, started)
+
+    def render_bundles(self, bundle_names, kind=None):
+        """
+        Render the union of several bundles, files shared by them (webpack
+        splitChunks runtime, vendors) are emitted once
+        """
+        started = time.perf_counter() if observed(bundle_rendered) else None
+        names = normalize_names(bundle_names)
+        for name in names:
+            self.manifest.ensure_loaded(name)
+        return self.render_snapshot(self.manifest.snapshot, names, kind,
+                                    started)
+
+    async def arender_bundles(self, bundle_names, kind=None):
+        started = time.perf_counter() if observed(bundle_rendered) else None
+        names = normalize_names(bundle_names)
+        for name in names:
+            await self.manifest.aensure_loaded(name)
+        return self.render_snapshot(self.manifest.snapshot, names, kind,
+                                    started)
+
+    def get_items(self, snapshot, bundle_name, kind):
+        """
+        ``(bundle, name, asset)`` to render for ``bundle_name``, a bundle
+        name or a tuple of them merged through the snapshot ChunkGraph
+        """
+        key = (bundle_name, kind)
+        source = get_source(snapshot, bundle_name)
+        cached = items.get(key, source)
+        if cached is not None:
+            return cached
+        if isinstance(bundle_name, tuple):
+            bundles = [snapshot.get_bundle(name) for name in bundle_name]
+            cached = get_graph(snapshot).merge(bundles, kind)
+        else:
+            cached = [(source, name, asset)
+                      for name, asset in source.filter_assets(kind)]
+        items.set(key, source, cached)
+        return cached
+
+    def render_snapshot(self, snapshot, bundle_name, kind=None, started=None):
+        """
+        Render ``bundle_name`` (or a tuple of names) as found in
+        ``snapshot``, ``started`` is the perf_counter() reported to
+        bundle_rendered
+        """
+        kind = normalize_kind(kind)
+        key = (bundle_name, kind)
+        collected = rendered_bundles.get()
+        if collected is not None:
+            if isinstance(bundle_name, tuple):
+                collected.extend((name, kind) for name in bundle_name)
+            else:
+                collected.append(key)
+        source = get_source(snapshot, bundle_name)
+        emitted = emitted_assets.get()
+        skipped = None
+        if emitted is not None:
+            # Fragments depend on the assets already emitted
+            to_render = self.get_items(snapshot, bundle_name, kind)
+            names = [item[1] for item in to_render]
+            skipped = frozenset(emitted.intersection(names))
+            emitted.update(names)
+            if skipped:
+                key += (skipped,)
+        fragment = fragments.get(key, source)
+        cached = fragment is not None
+        if cached:
+            if observed(cache_hit):
+                cache_hit.send(sender=None, cache="fragments", key=key)
+        else:
+            if observed(cache_miss):
+                cache_miss.send(sender=None, cache="fragments", key=key)
+            to_render = self.get_items(snapshot, bundle_name, kind)
+            if skipped:
+                to_render = [item for item in to_render
+                             if item[1] not in skipped]
+            fragment = render_items(to_render)
+            fragments.set(key, source, fragment)
+        if started is not None and observed(bundle_rendered):
+            bundle_rendered.send(
+                sender=self.__class__, bundle=bundle_name, kind=kind,
+                duration=time.perf_counter() - started, cached=cached)
+        return fragment
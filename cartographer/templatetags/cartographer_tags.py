@@ -5,7 +5,8 @@ Assets tags
 
 from django.template.defaulttags import register
 
-from cartographer.tagsmanager import AssetTagsManagerFromManifest
+from cartographer.tagsmanager import (AssetTagsManagerFromManifest,
+                                      normalize_kind)
 
 
 @register.simple_tag
@@ -16,5 +17,17 @@ def render_bundle(bundle_name, kind=None):
     {% render_bundle "bundle_name" "js, css" %}
     """
     # Django tags does not accept a list as arguments
-    kind = (ext.strip() for ext in kind.split(",")) if kind else [""]
+    kind = normalize_kind(kind)
     return AssetTagsManagerFromManifest().render_bundle(bundle_name, kind)
+
+
+@register.simple_tag
+def render_bundles(bundle_names, kind=None):
+    """
+    {% render_bundles "main, admin" %}
+    {% render_bundles "main, admin" "js" %}
+    Files shared by the bundles are emitted once, in an order valid for
+    every bundle
+    """
+    kind = normalize_kind(kind)
+    return AssetTagsManagerFromManifest().render_bundles(bundle_names, kind)
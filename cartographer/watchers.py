@@ -0,0 +1,215 @@
+#! -*- coding: utf-8 -*-
+"""
+Sources watchers, reload updatable bundles when their source changes
+"""
+
+import logging
+import os
+import threading
+
+from django.utils.module_loading import import_string
+
+from .files import hash_file
+from .parsers import rediscover
+from .signals import observed, reload_triggered
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+logger = logging.getLogger(__name__)
+
+
+class Debouncer(object):
+    """
+    Coalesce bursts of changes, the callback receives every changed source
+    once nothing happened for ``delay`` seconds
+    """
+    def __init__(self, callback, delay):
+        self.callback = callback
+        self.delay = delay
+        self.pending = set()
+        self.events = 0
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def touch(self, source):
+        with self.lock:
+            self.pending.add(source)
+            self.events += 1
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = threading.Timer(self.delay, self.flush)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            sources, self.pending = self.pending, set()
+            events, self.events = self.events, 0
+            self.timer = None
+        if sources:
+            if observed(reload_triggered):
+                reload_triggered.send(sender=None, sources=sources,
+                                      events=events)
+            self.callback(sources)
+
+    def cancel(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = None
+            self.pending = set()
+            self.events = 0
+
+
+class BaseWatcher(object):
+    """
+    Watches a set of sources, changes are debounced before calling back
+    ``options`` are the cartographer options, backends pick what they need
+    """
+    def __init__(self, sources, callback, options):
+        self.sources = frozenset(os.path.abspath(source)
+                                 for source in sources if source)
+        self.debouncer = Debouncer(callback, options['WATCHER_DELAY'])
+
+    def notify(self, path):
+        """
+        Backends call this for every change seen on ``path``
+        """
+        path = os.path.abspath(path)
+        if path in self.sources:
+            self.debouncer.touch(path)
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        self.debouncer.cancel()
+
+
+class InotifyWatcher(BaseWatcher):
+    """
+    pyinotify backend
+
+    Parent directories are watched instead of the files, atomic writes
+    replace the watched inode and only show up as a move on the directory
+    """
+    def get_mask(self):
+        return pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO
+
+    def start(self):
+        if pyinotify is None:
+            raise ImportError("pyinotify is required by the inotify watcher")
+        watcher = self
+
+        class EventHandler(pyinotify.ProcessEvent):
+            def process_default(self, event):
+                watcher.notify(event.pathname)
+
+        self.manager = pyinotify.WatchManager()
+        self.notifier = pyinotify.ThreadedNotifier(self.manager,
+                                                   EventHandler())
+        self.notifier.daemon = True
+        self.notifier.start()
+        for directory in {os.path.dirname(src) for src in self.sources}:
+            self.manager.add_watch(directory, self.get_mask())
+
+    def stop(self):
+        super(InotifyWatcher, self).stop()
+        self.notifier.stop()
+
+
+class PollingWatcher(BaseWatcher):
+    """
+    Dependency free backend, works where inotify does not (network and
+    overlay mounts)
+
+    Sources are stat'ed every ``interval`` seconds, a changed mtime or size
+    only triggers a reload when the content hash changed too
+    """
+    def __init__(self, sources, callback, options):
+        super(PollingWatcher, self).__init__(sources, callback, options)
+        self.interval = options['POLL_INTERVAL']
+        self.stopped = threading.Event()
+        self.signatures = {}
+        self.digests = {}
+
+    @staticmethod
+    def get_signature(path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    @staticmethod
+    def get_digest(path):
+        try:
+            return hash_file(path)
+        except OSError:
+            return None
+
+    def check(self, path):
+        """
+        Notify ``path`` if its bytes changed since the last check
+        """
+        signature = self.get_signature(path)
+        if signature == self.signatures.get(path):
+            return
+        self.signatures[path] = signature
+        digest = self.get_digest(path)
+        if digest != self.digests.get(path):
+            self.digests[path] = digest
+            self.notify(path)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            for path in self.sources:
+                self.check(path)
+
+    def start(self):
+        # Current state is the baseline, a first touch leaving the bytes
+        # unchanged must not reload
+        for path in self.sources:
+            self.signatures[path] = self.get_signature(path)
+            self.digests[path] = self.get_digest(path)
+        self.thread = threading.Thread(target=self.run,
+                                       name="cartographer-poll")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        super(PollingWatcher, self).stop()
+        self.stopped.set()
+
+
+WATCHERS = {
+    "inotify": InotifyWatcher,
+    "poll": PollingWatcher,
+}
+
+
+def get_watcher_class(name):
+    """
+    Resolve a watcher backend, "auto" prefers inotify when available,
+    anything else than a known name is imported as a dotted path
+    """
+    if name == "auto":
+        name = "inotify" if pyinotify is not None else "poll"
+    if name in WATCHERS:
+        return WATCHERS[name]
+    return import_string(name)
+
+
+def reload_sources(sources):
+    """
+    Watchers callback, reload the bundles of the changed sources
+    """
+    logger.debug("Reloading sources %s", ", ".join(sorted(sources)))
+    try:
+        rediscover(sources)
+    except Exception:
+        # Keep watching, the next build will probably fix it
+        logger.exception("Error reloading %s", ", ".join(sorted(sources)))
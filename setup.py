@@ -10,7 +10,10 @@ os.chdir(os.path.normpath(os.path.join(os.path.abspath(__file__), os.pardir)))
 setup(
     name='django-cartographer',
     version='0.1',
-    packages=['cartographer'],
+    packages=['cartographer',
+              'cartographer.templatetags',
+              'cartographer.management',
+              'cartographer.management.commands'],
     include_package_data=True,
     # license='BSD License',  # example license
     description='Central registry assets manager for django',